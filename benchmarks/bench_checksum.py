@@ -0,0 +1,126 @@
+"""Throughput benchmark of the asset checksum.
+
+Writes large random files and compares the MB/s of ``checksum.multihash_sha256`` with
+``bdc_catalog.utils.multihash_checksum_sha256``, the function used before, hashing the
+files one at a time and with several threads (like ``--asset-workers``). When bdc_catalog
+is not installed, the baseline is a plain ``hashlib`` loop with buffered 64 KB reads.
+The run fails when the checksums differ.
+
+The files are read from the page cache after the first pass; use ``--drop-cache``
+(root only) to measure cold reads.
+
+Usage:
+    python benchmarks/bench_checksum.py [--files 4] [--size-mb 512] [--threads 4] [--repeat 3]
+"""
+
+import argparse
+import hashlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#: Environment needed to import collection_publisher.config
+os.environ.setdefault('COLLECTION_PUBLISHER_LIST', 'CBERS,AMAZONIA,WFI,AWFI,MUX')
+
+
+def baseline_function():
+    """Checksum function used before, or a plain hashlib loop when bdc_catalog is missing."""
+    try:
+        from bdc_catalog.utils import multihash_checksum_sha256
+        return 'bdc_catalog', multihash_checksum_sha256
+    except ImportError:
+        def _hashlib_checksum(path):
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    sha256.update(chunk)
+            return '1220' + sha256.hexdigest()
+        return 'hashlib 64 KB', _hashlib_checksum
+
+
+def write_files(directory: str, files: int, size_mb: int) -> list:
+    paths = []
+    block = 2 ** 20
+    for index in range(files):
+        path = os.path.join(directory, f'bench_{index}.bin')
+        with open(path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(block))
+        paths.append(path)
+    return paths
+
+
+def drop_cache():
+    os.sync()
+    with open('/proc/sys/vm/drop_caches', 'w') as f:
+        f.write('3\n')
+
+
+def throughput(function, paths: list, threads: int, repeat: int, cold: bool) -> tuple:
+    """Hash the files ``repeat`` times.
+
+    Returns:
+        tuple (median MB/s, checksums)
+    """
+    total = sum(os.path.getsize(path) for path in paths) / 2 ** 20
+    rates = []
+    checksums = None
+
+    for _ in range(repeat):
+        if cold:
+            drop_cache()
+        start = time.perf_counter()
+        if threads > 1:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                checksums = list(executor.map(function, paths))
+        else:
+            checksums = [function(path) for path in paths]
+        rates.append(total / (time.perf_counter() - start))
+
+    return round(statistics.median(rates), 1), checksums
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--size-mb', type=int, default=512)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--read-size', type=int, default=None, help='Read size of multihash_sha256 in bytes')
+    parser.add_argument('--drop-cache', action='store_true', help='Drop the page cache before each pass')
+    parser.add_argument('--workdir', default=None, help='Directory of the files (default: a temporary one)')
+    args = parser.parse_args()
+
+    from collection_publisher.checksum import multihash_sha256
+
+    function = multihash_sha256
+    if args.read_size:
+        function = lambda path: multihash_sha256(path, read_size=args.read_size)
+
+    baseline_name, baseline = baseline_function()
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as directory:
+        paths = write_files(directory, args.files, args.size_mb)
+        print(f'{args.files} files of {args.size_mb} MB')
+
+        failed = False
+        for threads in sorted({1, args.threads}):
+            base_rate, base_checksums = throughput(baseline, paths, threads, args.repeat, args.drop_cache)
+            rate, checksums = throughput(function, paths, threads, args.repeat, args.drop_cache)
+            print(f'threads={threads}: {baseline_name} {base_rate} MB/s, '
+                  f'multihash_sha256 {rate} MB/s ({rate / base_rate:.2f}x)')
+            if checksums != base_checksums:
+                print('  the checksums differ!')
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+"""Throughput benchmark of the collection publisher.
+
+Generates synthetic data (see ``synthetic.py``), publishes it with ``process_file`` in each
+of the requested modes against a local catalog and reports items/s, MB/s and the
+per-stage timings (checksum, probe, srid, extent, footprint, NetCDF read).
+
+The catalog is the database of ``SQLALCHEMY_DATABASE_URI``, e.g. a local PostgreSQL/PostGIS
+initialized with ``bdc-catalog db init && bdc-catalog db create-schema``. The collections
+given by ``--collection`` and ``--goes-collection`` must exist, or be created with
+``--create-collections``. Every run publishes new items (the item names get a run suffix);
+use ``--cleanup`` to delete them at the end.
+
+Modes:
+    serial      one item at a time
+    threads     the assets of an item in a thread pool (``--asset-workers``)
+    bulk        batched transactions (``--batch-size``)
+    processes   items in a process pool (``--workers``)
+
+Usage:
+    python benchmarks/bench_publish.py --workdir /tmp/bench --items 50 --bands 7 --size 2048
+                                       [--modes serial,threads,bulk,processes] [--stages-only]
+                                       [--save baseline.json | --compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+
+MODES = ('serial', 'threads', 'bulk', 'processes')
+
+#: Default GOES collection, see ``goes_collections`` in collection_publisher.config
+GOES_COLLECTION = 'GOES16-L2-CMI-1'
+
+
+def setup_environment(workdir: str):
+    """Set the publisher environment before collection_publisher.config is imported."""
+    os.environ.setdefault('COLLECTION_PUBLISHER_LIST', 'BENCH,GOES_BENCH')
+    os.environ.setdefault('COLLECTION_PUBLISHER_PREFIX', workdir)
+    os.environ.setdefault('COLLECTION_PUBLISHER_PREFIX_DATA', '/bench')
+    os.environ.setdefault('COLLECTION_PUBLISHER_CONTAINER_FILE_PROCESSED', os.path.join(workdir, 'processed'))
+    os.environ.setdefault('COLLECTION_PUBLISHER_CONTAINER_LOG_DIR', os.path.join(workdir, 'log'))
+
+
+def files_size(manifest: str) -> int:
+    """Total size in bytes of the assets of a manifest."""
+    with open(manifest) as f:
+        items = json.load(f)
+    return sum(os.path.getsize(path) for item in items for path in item['assets'].values())
+
+
+def timed(function, *args, **kwargs) -> float:
+    """Run ``function`` and return its duration in seconds."""
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def summary(values: list) -> dict:
+    """Mean, median and max of a list of durations, in milliseconds."""
+    if not values:
+        return dict(count=0)
+    return dict(count=len(values),
+                mean_ms=round(statistics.mean(values) * 1000, 3),
+                median_ms=round(statistics.median(values) * 1000, 3),
+                max_ms=round(max(values) * 1000, 3))
+
+
+def bench_stages(manifest: str, goes_manifest: str = None) -> dict:
+    """Time each metadata stage on the files of the manifests, outside of the database.
+
+    Returns:
+        dict stage -> timing summary, plus the checksum throughput in MB/s
+    """
+    from collection_publisher import cli
+    from collection_publisher.checksum import multihash_checksum
+    from collection_publisher.footprint import get_footprint
+    from collection_publisher.raster import open_probe
+
+    stages = dict(checksum=[], probe=[], srid=[], extent=[], footprint=[], netcdf=[])
+    hashed = 0
+
+    with open(manifest) as f:
+        items = json.load(f)
+
+    for item in items:
+        for key, path in item['assets'].items():
+            hashed += os.path.getsize(path)
+            stages['checksum'].append(timed(multihash_checksum, path))
+            if key != 'thumbnail':
+                stages['probe'].append(timed(lambda: open_probe(path).close()))
+
+        # Like prepare_item, the srid and the geometries come from the reference band
+        band = item['assets'][cli.reference_band(cli.asset_jobs(item['assets']))]
+        stages['srid'].append(timed(cli.epsg_srid, band))
+        stages['extent'].append(timed(cli.raster_extent, band))
+        stages['footprint'].append(timed(get_footprint, band))
+
+    if goes_manifest:
+        from netCDF4 import Dataset
+
+        def _read_extent(path):
+            with Dataset(path) as nc:
+                extent = nc.variables['geospatial_lat_lon_extent']
+                return (extent.geospatial_westbound_longitude, extent.geospatial_southbound_latitude,
+                        extent.geospatial_eastbound_longitude, extent.geospatial_northbound_latitude)
+
+        with open(goes_manifest) as f:
+            for item in json.load(f):
+                for path in item['assets'].values():
+                    hashed += os.path.getsize(path)
+                    stages['checksum'].append(timed(multihash_checksum, path))
+                    stages['netcdf'].append(timed(_read_extent, path))
+                    stages['srid'].append(timed(cli.epsg_srid, path))
+
+    checksum_time = sum(stages['checksum'])
+    result = {stage: summary(values) for stage, values in stages.items()}
+    result['checksum']['mb_per_s'] = round(hashed / 2 ** 20 / checksum_time, 2) if checksum_time else None
+    return result
+
+
+def ensure_collection(identifier: str):
+    """Create a minimal collection (name-version) when it does not exist."""
+    from bdc_catalog.models import Collection, db
+
+    from collection_publisher.cli import get_or_create_model
+
+    name, version = identifier.rsplit('-', 1)
+    _, created = get_or_create_model(Collection,
+                                     defaults=dict(name=name, version=version, title=f'Benchmark {name}',
+                                                   collection_type='collection', is_available=True),
+                                     name=name, version=version)
+    db.session.commit()
+    if created:
+        print(f'Collection {identifier} created.')
+
+
+def delete_items(identifier: str, suffix: str):
+    """Delete the items published by a benchmark run."""
+    from bdc_catalog.models import Item, db
+
+    from collection_publisher.cli import collection_by_identifier
+
+    collection = collection_by_identifier(identifier)
+    deleted = (db.session.query(Item)
+               .filter(Item.collection_id == collection.id, Item.name.like(f'%_{suffix}'))
+               .delete(synchronize_session=False))
+    db.session.commit()
+    return deleted
+
+
+def run_mode(mode: str, args, manifests: list, run_id: str) -> dict:
+    """Publish the manifests with ``process_file`` in one mode.
+
+    Returns:
+        dict with the item count, the published and failed counts, the wall time and the throughput
+    """
+    from bdc_catalog.models import Item, db
+
+    from collection_publisher import cli
+
+    options = dict(asset_workers=1, workers=1, batch_size=0, preload_items=True)
+    if mode == 'threads':
+        options['asset_workers'] = args.asset_workers
+    elif mode == 'bulk':
+        options['batch_size'] = args.batch_size
+    elif mode == 'processes':
+        options['workers'] = args.workers
+        options['asset_workers'] = args.asset_workers
+
+    suffix = f'{run_id}{mode}'
+    copies = []
+    total_bytes = 0
+    total_items = 0
+    for collection, manifest in manifests:
+        output = os.path.join(args.workdir, 'runs', f'{os.path.basename(manifest)[:-5]}_{suffix}.json')
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        copies.append((collection, synthetic.rename_items(manifest, output, suffix)))
+        total_bytes += files_size(manifest)
+        with open(manifest) as f:
+            total_items += len(json.load(f))
+
+    catalog = cli.CatalogCache()
+
+    # Warm the page cache, so the modes are compared on the same footing
+    for _, manifest in copies:
+        files_size(manifest)
+
+    start = time.perf_counter()
+    for collection, manifest in copies:
+        process_start = time.perf_counter()
+        cli.process_file(collection, manifest, False, catalog=catalog, **options)
+        print(f'  {mode:10s} {os.path.basename(manifest)}: {time.perf_counter() - process_start:.2f}s')
+    elapsed = time.perf_counter() - start
+
+    published = 0
+    for collection, _ in copies:
+        published += (db.session.query(Item)
+                      .filter(Item.collection_id == catalog.collection(collection).id,
+                              Item.name.like(f'%_{suffix}'))
+                      .count())
+
+    if args.cleanup:
+        for collection, _ in copies:
+            delete_items(collection, suffix)
+
+    return dict(options=options,
+                items=total_items,
+                published=published,
+                failed=total_items - published,
+                seconds=round(elapsed, 3),
+                items_per_s=round(total_items / elapsed, 3),
+                mb_per_s=round(total_bytes / 2 ** 20 / elapsed, 2))
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """List the modes and stages slower than the baseline by more than ``tolerance``."""
+    regressions = []
+
+    for mode, values in results.get('modes', {}).items():
+        reference = baseline.get('modes', {}).get(mode)
+        if reference and values['items_per_s'] < reference['items_per_s'] * (1 - tolerance):
+            regressions.append(f'{mode}: {values["items_per_s"]} items/s, '
+                               f'baseline {reference["items_per_s"]} items/s')
+
+    for stage, values in results.get('stages', {}).items():
+        reference = baseline.get('stages', {}).get(stage)
+        if reference and values.get('count') and reference.get('count') \
+                and values['median_ms'] > reference['median_ms'] * (1 + tolerance):
+            regressions.append(f'stage {stage}: {values["median_ms"]} ms, baseline {reference["median_ms"]} ms')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'collection_publisher_bench'),
+                        help='Directory of the synthetic data; existing files are reused')
+    parser.add_argument('--items', type=int, default=20, help='Number of scene items')
+    parser.add_argument('--bands', type=int, default=7, help='Number of COG bands per item')
+    parser.add_argument('--size', type=int, default=2048, help='Width and height of the bands, in pixels')
+    parser.add_argument('--goes-items', type=int, default=0, help='Number of GOES-like NetCDF items')
+    parser.add_argument('--goes-size', type=int, default=1000, help='Width and height of the NetCDF grid')
+    parser.add_argument('--collection', default='BENCH-1', help='Collection (name-version) of the scene items')
+    parser.add_argument('--goes-collection', default=GOES_COLLECTION, help='Collection of the GOES items')
+    parser.add_argument('--create-collections', action='store_true', help='Create the collections when missing')
+    parser.add_argument('--modes', default='serial,threads,bulk,processes', help='Comma separated modes')
+    parser.add_argument('--asset-workers', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--stages-only', action='store_true', help='Only time the stages, without a database')
+    parser.add_argument('--cleanup', action='store_true', help='Delete the published items after each mode')
+    parser.add_argument('--save', help='Save the results as a baseline JSON file')
+    parser.add_argument('--compare', help='Compare with a baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown over the baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    modes = [mode for mode in args.modes.split(',') if mode]
+    invalid = set(modes) - set(MODES)
+    if invalid:
+        parser.error(f'Invalid modes {", ".join(sorted(invalid))}, expected {", ".join(MODES)}.')
+
+    args.workdir = os.path.abspath(args.workdir)
+    setup_environment(args.workdir)
+
+    print(f'Generating {args.items} items x {args.bands} bands of {args.size}x{args.size} '
+          f'and {args.goes_items} GOES items in {args.workdir}...')
+    start = time.perf_counter()
+    manifests = [(args.collection, synthetic.generate_scenes(os.path.join(args.workdir, 'scenes'),
+                                                             args.items, args.bands, args.size))]
+    goes_manifest = None
+    if args.goes_items:
+        goes_manifest = synthetic.generate_goes(os.path.join(args.workdir, 'goes'), args.goes_items, args.goes_size)
+        manifests.append((args.goes_collection, goes_manifest))
+    print(f'Data ready in {time.perf_counter() - start:.1f}s '
+          f'({sum(files_size(m) for _, m in manifests) / 2 ** 20:.1f} MB).')
+
+    results = dict(created=datetime.utcnow().isoformat(),
+                   parameters=dict(items=args.items, bands=args.bands, size=args.size,
+                                   goes_items=args.goes_items, goes_size=args.goes_size))
+
+    print('Timing the stages...')
+    results['stages'] = bench_stages(manifests[0][1], goes_manifest)
+    for stage, values in results['stages'].items():
+        if values.get('count'):
+            extra = f'  {values["mb_per_s"]} MB/s' if 'mb_per_s' in values else ''
+            print(f'  {stage:10s} median {values["median_ms"]:9.2f} ms  '
+                  f'mean {values["mean_ms"]:9.2f} ms  max {values["max_ms"]:9.2f} ms{extra}')
+
+    if not args.stages_only:
+        from collection_publisher.cli import create_app
+
+        run_id = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        results['modes'] = dict()
+
+        with create_app().app_context():
+            if args.create_collections:
+                for collection, _ in manifests:
+                    ensure_collection(collection)
+
+            for mode in modes:
+                print(f'Publishing ({mode})...')
+                results['modes'][mode] = run_mode(mode, args, manifests, run_id)
+
+        print(f'{"mode":10s} {"items":>6s} {"failed":>6s} {"seconds":>9s} {"items/s":>9s} {"MB/s":>9s}')
+        for mode, values in results['modes'].items():
+            print(f'{mode:10s} {values["items"]:6d} {values["failed"]:6d} {values["seconds"]:9.2f} '
+                  f'{values["items_per_s"]:9.2f} {values["mb_per_s"]:9.2f}')
+
+    failed = False
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for regression in compare(results, baseline, args.tolerance):
+            print(f'FAIL: {regression}')
+            failed = True
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Startup-time benchmark of the collection publisher command line.
+
+Imports ``collection_publisher.cli`` in a fresh interpreter with ``python -X importtime``
+and reports the import cost. The run fails when a heavy geo library is imported at
+startup, when the import takes longer than ``--max-ms`` or when it is slower than a
+saved baseline by more than ``--tolerance``.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5] [--max-ms 1500]
+                                       [--save baseline.json | --compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+#: Modules that must only be imported by the code paths that need them
+HEAVY_MODULES = ('rasterio', 'osgeo', 'numpy', 'pyproj', 'shapely',
+                 'pandas', 'geopandas', 'netCDF4')
+
+#: Environment needed to import collection_publisher.config
+DEFAULT_ENV = {
+    'COLLECTION_PUBLISHER_LIST': 'CBERS,AMAZONIA,WFI,AWFI,MUX',
+    'COLLECTION_PUBLISHER_PREFIX': '/dados/oper',
+    'COLLECTION_PUBLISHER_PREFIX_DATA': 'data',
+}
+
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def import_times(module: str) -> dict:
+    """Import ``module`` in a new interpreter.
+
+    Returns:
+        dict name -> cumulative import time in microseconds of ``module`` and of the
+        modules it imported
+    """
+    env = dict(DEFAULT_ENV, **os.environ)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        sys.exit(f'Error importing {module}:\n{result.stderr}')
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            _, cumulative, indent, name = match.groups()
+            entries.append((name, int(cumulative), len(indent)))
+
+    # The imports made by ``module`` are listed right before it, with a deeper indentation
+    times = dict()
+    for index, (name, cumulative, indent) in enumerate(entries):
+        if name == module:
+            times[name] = cumulative
+            for child, child_cumulative, child_indent in reversed(entries[:index]):
+                if child_indent <= indent:
+                    break
+                times.setdefault(child, child_cumulative)
+            break
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='collection_publisher.cli', help='Module to import')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of imports; the median is reported')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest modules listed')
+    parser.add_argument('--max-ms', type=float, help='Fail when the import takes longer than this')
+    parser.add_argument('--save', help='Save the result as a baseline JSON file')
+    parser.add_argument('--compare', help='Compare with a baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown over the baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    total_ms = statistics.median(run[args.module] for run in runs) / 1000
+    last = runs[-1]
+
+    print(f'{args.module}: {total_ms:.1f} ms (median of {args.repeat})')
+    print('Slowest modules (cumulative):')
+    top_level = {name: value for name, value in last.items() if '.' not in name and name != args.module}
+    for name, value in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'  {value / 1000:10.1f} ms  {name}')
+
+    failed = False
+
+    heavy = sorted(name for name in top_level if name in HEAVY_MODULES)
+    if heavy:
+        print(f'FAIL: heavy modules imported at startup: {", ".join(heavy)}')
+        failed = True
+
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f'FAIL: import took {total_ms:.1f} ms, more than {args.max_ms} ms')
+        failed = True
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        limit = baseline['total_ms'] * (1 + args.tolerance)
+        print(f'Baseline: {baseline["total_ms"]:.1f} ms (limit {limit:.1f} ms)')
+        if total_ms > limit:
+            print(f'FAIL: import is {total_ms / baseline["total_ms"] - 1:.0%} slower than the baseline')
+            failed = True
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(dict(module=args.module, total_ms=total_ms, heavy=heavy), f, indent=2)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
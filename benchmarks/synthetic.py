@@ -0,0 +1,191 @@
+"""Synthetic data for the publisher benchmarks.
+
+Generates cloud optimized GeoTIFF bands, PNG thumbnails and GOES-like NetCDF files,
+plus the manifests that reference them, at a configurable scale.
+"""
+
+import json
+import os
+import warnings
+
+from datetime import datetime, timedelta
+
+import numpy
+import rasterio
+import rasterio.shutil
+
+from rasterio.enums import Resampling
+from rasterio.errors import NotGeoreferencedWarning
+from rasterio.transform import from_origin
+
+#: Band keys used in the synthetic data cube / scene manifests
+BAND_KEYS = ('coastal', 'blue', 'green', 'red', 'nir08', 'swir16', 'swir22',
+             'qa_pixel', 'st_qa', 'lwir11', 'B01', 'B02', 'B03', 'B04', 'B05',
+             'B06', 'B07', 'B08', 'B09', 'B10')
+
+
+def _valid_mask(size: int, seed: int) -> numpy.ndarray:
+    """Scene-like mask: a rotated valid region with noisy borders."""
+    rng = numpy.random.default_rng(seed)
+    yy, xx = numpy.mgrid[0:size, 0:size]
+    margin = size // 8
+    mask = ((xx + yy > size // 4) & (xx + yy < 2 * size - size // 4)
+            & (abs(xx - yy) < size - margin))
+    noise = rng.random((size, size)) < 0.002
+    return mask & ~noise
+
+
+def write_cog(path: str, size: int = 2048, block: int = 512, seed: int = 0,
+              crs: str = 'EPSG:32723', origin=(500000, 8000000), resolution: float = 30):
+    """Write a single band cloud optimized GeoTIFF with nodata outside of a scene-like region."""
+    rng = numpy.random.default_rng(seed)
+    data = rng.integers(1, 10000, (size, size), dtype='uint16')
+    data[~_valid_mask(size, seed)] = 0
+
+    profile = dict(driver='GTiff', width=size, height=size, count=1, dtype='uint16',
+                   crs=crs, transform=from_origin(*origin, resolution, resolution), nodata=0,
+                   tiled=True, blockxsize=block, blockysize=block, compress='deflate')
+
+    tmp = path + '.tmp.tif'
+    with rasterio.open(tmp, 'w', **profile) as dataset:
+        dataset.write(data, 1)
+        dataset.build_overviews([2, 4, 8, 16], Resampling.nearest)
+
+    try:
+        rasterio.shutil.copy(tmp, path, driver='COG', blocksize=block, compress='DEFLATE')
+    except Exception:
+        # GDAL < 3.1 has no COG driver: keep the tiled GeoTIFF with internal overviews
+        rasterio.shutil.copy(tmp, path, driver='GTiff', tiled=True, blockxsize=block, blockysize=block,
+                             copy_src_overviews=True, compress='deflate')
+    os.remove(tmp)
+
+
+def write_png(path: str, size: int = 256, seed: int = 0):
+    """Write a RGB PNG thumbnail."""
+    rng = numpy.random.default_rng(seed)
+    data = rng.integers(0, 255, (3, size, size), dtype='uint8')
+    warnings.simplefilter('ignore', NotGeoreferencedWarning)
+    with rasterio.open(path, 'w', driver='PNG', width=size, height=size, count=3, dtype='uint8') as dataset:
+        dataset.write(data)
+
+
+def write_goes(path: str, size: int = 1000, seed: int = 0):
+    """Write a GOES-R ABI L2 CMI like NetCDF file (geostationary grid and lat/lon extent)."""
+    from netCDF4 import Dataset
+
+    rng = numpy.random.default_rng(seed)
+
+    with Dataset(path, 'w') as nc:
+        nc.platform_ID = 'G16'
+        nc.scene_id = 'Full Disk'
+        nc.dataset_name = os.path.basename(path)
+
+        nc.createDimension('y', size)
+        nc.createDimension('x', size)
+
+        x = nc.createVariable('x', 'f4', ('x',))
+        y = nc.createVariable('y', 'f4', ('y',))
+        x[:] = numpy.linspace(-0.151844, 0.151844, size)
+        y[:] = numpy.linspace(0.151844, -0.151844, size)
+
+        projection = nc.createVariable('goes_imager_projection', 'i4')
+        projection.grid_mapping_name = 'geostationary'
+        projection.perspective_point_height = 35786023.0
+        projection.semi_major_axis = 6378137.0
+        projection.semi_minor_axis = 6356752.31414
+        projection.longitude_of_projection_origin = -75.0
+        projection.latitude_of_projection_origin = 0.0
+        projection.sweep_angle_axis = 'x'
+
+        cmi = nc.createVariable('CMI', 'u2', ('y', 'x'), zlib=True)
+        cmi.grid_mapping = 'goes_imager_projection'
+        cmi[:] = rng.integers(0, 4095, (size, size), dtype='uint16')
+
+        extent = nc.createVariable('geospatial_lat_lon_extent', 'f4')
+        extent.geospatial_westbound_longitude = -156.2995
+        extent.geospatial_southbound_latitude = -81.3282
+        extent.geospatial_eastbound_longitude = 6.2995
+        extent.geospatial_northbound_latitude = 81.3282
+
+
+def generate_scenes(directory: str, items: int, bands: int, size: int, prefix: str = 'BENCH') -> str:
+    """Generate ``items`` scenes of ``bands`` COG bands plus a thumbnail, and their manifest.
+
+    Returns:
+        str path of the manifest
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    manifest = []
+    start = datetime(2024, 1, 1)
+
+    for index in range(items):
+        name = f'{prefix}_{index:05d}'
+        item_dir = os.path.join(directory, name)
+        os.makedirs(item_dir, exist_ok=True)
+
+        assets = dict()
+        for band in BAND_KEYS[:bands]:
+            path = os.path.join(item_dir, f'{name}_{band}.tif')
+            if not os.path.exists(path):
+                write_cog(path, size=size, seed=index)
+            assets[band] = path
+
+        thumbnail = os.path.join(item_dir, f'{name}.png')
+        if not os.path.exists(thumbnail):
+            write_png(thumbnail, seed=index)
+        assets['thumbnail'] = thumbnail
+
+        date = start + timedelta(days=index)
+        manifest.append(dict(name=name,
+                             start_date=date.strftime('%Y-%m-%dT%H:%M:%S'),
+                             end_date=date.strftime('%Y-%m-%dT%H:%M:%S'),
+                             cloud_cover=0.0,
+                             assets=assets))
+
+    path = os.path.join(directory, f'{prefix}.json')
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def generate_goes(directory: str, items: int, size: int, prefix: str = 'GOES_BENCH') -> str:
+    """Generate ``items`` GOES-like NetCDF files, one every 10 minutes, and their manifest.
+
+    Returns:
+        str path of the manifest
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    manifest = []
+    start = datetime(2024, 1, 1)
+
+    for index in range(items):
+        date = start + timedelta(minutes=10 * index)
+        name = f'{prefix}_{date.strftime("%Y%m%d%H%M")}'
+        path = os.path.join(directory, f'{name}.nc')
+        if not os.path.exists(path):
+            write_goes(path, size=size, seed=index)
+
+        manifest.append(dict(name=name,
+                             start_date=date.strftime('%Y-%m-%dT%H:%M:%S'),
+                             end_date=(date + timedelta(minutes=10)).strftime('%Y-%m-%dT%H:%M:%S'),
+                             assets={'B13': path}))
+
+    path = os.path.join(directory, f'{prefix}.json')
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def rename_items(manifest: str, output: str, run_id: str) -> str:
+    """Copy a manifest giving new names to its items, so a run publishes new items."""
+    with open(manifest) as f:
+        items = json.load(f)
+
+    for item in items:
+        item['name'] = f"{item['name']}_{run_id}"
+
+    with open(output, 'w') as f:
+        json.dump(items, f)
+    return output
@@ -0,0 +1,193 @@
+"""Checksum of the assets, with an optional persistent cache.
+
+The cache is a local SQLite file that stores the ``checksum:multihash`` of the files
+already hashed. An entry is reused only when the file fingerprint (path, size,
+modification time and inode) did not change, so re-sent items are not hashed again.
+
+The files are hashed by `multihash_sha256`: large reads into a reused buffer, with a
+sequential read hint to the kernel. Both the reads and `hashlib` release the GIL, so
+the assets of an item hashed by the threads of `cli.create_assets` run in parallel.
+"""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import time
+
+from logging import debug, warning
+from typing import Optional
+
+from .config import checksum_read_size
+
+#: Multihash prefix of a sha2-256 digest: function code 0x12 and digest length 0x20
+SHA2_256_PREFIX = '1220'
+
+
+def multihash_sha256(file_path: str, read_size: int = checksum_read_size) -> str:
+    """Hash a file with sha2-256, in the ``checksum:multihash`` format of
+    ``bdc_catalog.utils.multihash_checksum_sha256`` (hex multihash).
+
+    Args:
+        file_path - Path to the file
+        read_size - Size of each read, rounded up to a multiple of the page size
+    """
+    read_size = max(mmap.PAGESIZE, -(-read_size // mmap.PAGESIZE) * mmap.PAGESIZE)
+    sha256 = hashlib.sha256()
+
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+        buffer = bytearray(read_size)
+        view = memoryview(buffer)
+        while True:
+            count = os.readv(fd, [buffer])
+            if not count:
+                break
+            sha256.update(view[:count])
+    finally:
+        os.close(fd)
+
+    return SHA2_256_PREFIX + sha256.hexdigest()
+
+
+class ChecksumCache:
+    """Persistent cache of file checksums.
+
+    Args:
+        path - SQLite file of the cache
+        max_entries - Maximum number of entries; the least recently used are evicted
+        rehash - Flag to ignore the stored checksums (the new ones are still stored)
+    """
+
+    #: Number of insertions between two evictions
+    EVICT_INTERVAL = 1000
+
+    def __init__(self, path: str, max_entries: int = 1000000, rehash: bool = False):
+        self.path = path
+        self.max_entries = max_entries
+        self.rehash = rehash
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._inserts = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """SQLite connection of the current thread and process."""
+        pid, connection = getattr(self._local, 'connection', (None, None))
+        if pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''CREATE TABLE IF NOT EXISTS checksums (
+                                      path TEXT PRIMARY KEY,
+                                      size INTEGER NOT NULL,
+                                      mtime_ns INTEGER NOT NULL,
+                                      inode INTEGER NOT NULL,
+                                      multihash TEXT NOT NULL,
+                                      accessed REAL NOT NULL
+                                  )''')
+            connection.execute('CREATE INDEX IF NOT EXISTS checksums_accessed ON checksums (accessed)')
+            self._local.connection = (os.getpid(), connection)
+        return connection
+
+    def get(self, path: str, stat: os.stat_result) -> Optional[str]:
+        """Get the stored checksum of a file, or None when the fingerprint does not match."""
+        if self.rehash:
+            return None
+
+        row = self.connection.execute(
+            'SELECT multihash FROM checksums WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?',
+            (path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        self.connection.execute('UPDATE checksums SET accessed = ? WHERE path = ?', (time.time(), path))
+        return row[0]
+
+    def put(self, path: str, stat: os.stat_result, multihash: str):
+        """Store the checksum of a file."""
+        self.connection.execute(
+            'INSERT OR REPLACE INTO checksums (path, size, mtime_ns, inode, multihash, accessed) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (path, stat.st_size, stat.st_mtime_ns, stat.st_ino, multihash, time.time())
+        )
+
+        with self._lock:
+            self._inserts += 1
+            evict = self._inserts % self.EVICT_INTERVAL == 0
+
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries above ``max_entries``."""
+        count, = self.connection.execute('SELECT COUNT(*) FROM checksums').fetchone()
+        if count > self.max_entries:
+            self.connection.execute(
+                'DELETE FROM checksums WHERE path IN '
+                '(SELECT path FROM checksums ORDER BY accessed LIMIT ?)',
+                (count - self.max_entries,)
+            )
+            debug(f"{count - self.max_entries} entries evicted from the checksum cache.")
+
+
+_cache: Optional[ChecksumCache] = None
+
+
+def configure_checksum_cache(path: Optional[str], max_entries: int = 1000000, rehash: bool = False):
+    """Enable the persistent checksum cache used by `multihash_checksum`.
+
+    Args:
+        path - SQLite file of the cache. When None, the cache is disabled.
+        max_entries - Maximum number of entries of the cache
+        rehash - Flag to force the files to be hashed again
+    """
+    global _cache
+
+    _cache = None
+    if path:
+        _cache = ChecksumCache(path, max_entries=max_entries, rehash=rehash)
+
+
+def multihash_checksum(file_path: str, stat: Optional[os.stat_result] = None) -> str:
+    """Get the ``checksum:multihash`` (sha2-256) of a file.
+
+    When the checksum cache is enabled and the file fingerprint matches a stored
+    entry, the stored checksum is returned without reading the file.
+
+    Args:
+        file_path - Path to the file
+        stat - Result of `os.stat` of the file, when already known
+    """
+    file_path = os.path.abspath(str(file_path))
+
+    if _cache is None:
+        return multihash_sha256(file_path)
+
+    if stat is None:
+        stat = os.stat(file_path)
+
+    try:
+        multihash = _cache.get(file_path, stat)
+    except sqlite3.Error as e:
+        warning(f"Error reading the checksum cache {_cache.path}: {e}")
+        multihash = None
+
+    if multihash is not None:
+        debug(f"Checksum of {file_path} found in the cache.")
+        return multihash
+
+    multihash = multihash_sha256(file_path)
+
+    try:
+        _cache.put(file_path, stat, multihash)
+    except sqlite3.Error as e:
+        warning(f"Error writing the checksum cache {_cache.path}: {e}")
+
+    return multihash
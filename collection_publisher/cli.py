@@ -1,36 +1,49 @@
 import os
-import json
 import click
 import mimetypes
 import re
-import shapely.geometry
-import pandas as pd
-import geopandas as gpd
-import rasterio
-import rasterio.warp
-import rasterio.features
-import rasterio.profiles
+import threading
+import time
 import traceback
+import contextvars
 import shutil
 
 from logging import info,debug,warning, error, basicConfig, INFO
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 from flask import Flask, current_app
 from flask.cli import FlaskGroup, with_appcontext
 from bdc_catalog import BDCCatalog
-from osgeo import gdal, osr
-from sqlalchemy import func
+from sqlalchemy import func, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects.postgresql import insert
 from bdc_catalog.models import Collection, Item, db, Tile
-from bdc_catalog.utils import multihash_checksum_sha256, geom_to_wkb
-from typing import List, Optional, Any
-from geoalchemy2.shape import from_shape
+from typing import TYPE_CHECKING, List, Optional, Any, Iterable
 from filelock import FileLock
 from pathlib import Path
-from netCDF4 import Dataset
+from .checksum import configure_checksum_cache, multihash_checksum
 from .config import *
 
-# Logging
-logList = []
+# The geo libraries (rasterio, GDAL, shapely, pyproj, netCDF4, ...) are imported by the
+# functions that use them, so commands like --help and --version start fast.
+if TYPE_CHECKING:
+    import shapely.geometry
+from .coordination import AnyEvent, Coordinator
+from .daemon import Interruptible, install_signal_handlers, scan_manifests, shutdown, watch_manifests
+from .footprint import FOOTPRINT_MODES, configure_footprint, get_footprint
+from .extent import CollectionExtent
+from .goes import goes_metadata
+from .grid import cache_geometry, cached_geometry, grid_signature
+from .incremental import changed_columns, reusable_assets, same_asset
+from .journal import Journal, journal_path
+from .logsink import capture_logs, file_log, replay
+from .metrics import (ItemTimer, configure_metrics, current_timer, dump_profiles, record, stage, start_run,
+                      summary, write_prometheus)
+from .preflight import preflight as check_manifest
+from .raster import probe_raster, probe_scope
+from .scheduler import Scheduler, manifest_collection
+from .manifest import ManifestError, iter_manifest
 
 fileslist = []
 
@@ -50,18 +63,90 @@ def cli():
 """Command line."""
 
 @cli.command()
-@click.option('-c', '--collection', type=click.STRING, help='BDC Catalog collection name', required=True)
+@click.option('-c', '--collection', type=click.STRING, help='BDC Catalog collection name (items may override it with the key "collection")', required=True)
 @click.option('-i', '--input-json', type=click.STRING, help='Input Json', required=False)
 @click.option('-l', '--log-level', help='Log level', required=False)
 @click.option('-d', '--directory', type=click.STRING, help='Directories where .json files are located', required=False)
 @click.option('-a', '--authenticate', help='Checks authenticity of .json files', required=False)
+@click.option('--asset-workers', type=click.INT, default=asset_workers,
+              help='Number of threads used to prepare the assets of an item', required=False)
+@click.option('-w', '--workers', type=click.INT, default=workers,
+              help='Number of processes used to compute the metadata of the items', required=False)
+@click.option('-b', '--batch-size', type=click.INT, default=batch_size,
+              help='Write the items in batches of this size with one transaction per batch (0 = disabled)',
+              required=False)
+@click.option('--preload-items/--no-preload-items', default=preload_items,
+              help='Load the names of the items already published once per collection and run, '
+                   'to skip them without a query per item (memory grows with the collection)', required=False)
+@click.option('--checksum-cache', type=click.STRING, default=checksum_cache,
+              help='SQLite file used to cache the checksums of the files already hashed', required=False)
+@click.option('--rehash', is_flag=True, default=False,
+              help='Hash the files again, ignoring the checksum cache', required=False)
+@click.option('--footprint-mode', type=click.Choice(FOOTPRINT_MODES), default=footprint_mode,
+              help='Footprint implementation: decimated mask (fast) or full resolution polygons (reference)',
+              required=False)
+@click.option('--footprint-tolerance', type=click.INT, default=footprint_tolerance,
+              help='Maximum footprint error, in pixels, of the fast footprint mode (the footprint is only enlarged)', required=False)
+@click.option('--manifest-workers', type=click.INT, default=manifest_workers,
+              help='Number of manifests of --directory processed at a time, by priority '
+                   '(requires --workers 1)', required=False)
+@click.option('--watch', is_flag=True, default=False,
+              help='Keep running and publish the .json files as they land in --directory', required=False)
+@click.option('--poll-interval', type=click.FLOAT, default=poll_interval,
+              help='Seconds between two scans of --directory in the watch mode', required=False)
+@click.option('--coordinate/--no-coordinate', default=coordinate,
+              help='Claim the manifests in the database, so several publishers can share the input directory',
+              required=False)
+@click.option('--lease-seconds', type=click.INT, default=lease_seconds,
+              help='Duration of a claim; the claims of a dead publisher are taken over after it', required=False)
+@click.option('--preflight/--no-preflight', default=preflight,
+              help='Check the asset files and keys of the manifest before publishing it', required=False)
+@click.option('--dry-run', is_flag=True, default=False,
+              help='Only run the pre-flight check of the manifests and write its report', required=False)
+@click.option('--journal-dir', type=click.STRING, default=journal_dir,
+              help='Directory of the journals used to resume the manifests', required=False)
+@click.option('--retry-failed', is_flag=True, default=False,
+              help='Publish again the items recorded as failed in the journal of the manifest', required=False)
+@click.option('--incremental/--no-incremental', default=incremental,
+              help='Reprocess the items flagged with "reprocess" computing and saving only what changed',
+              required=False)
+@click.option('--metrics-file', type=click.STRING, default=metrics_file,
+              help='JSON lines file where the per-stage timings of each item are appended', required=False)
+@click.option('--metrics-prom', type=click.STRING, default=metrics_prom,
+              help='Prometheus textfile (node_exporter textfile collector) updated after each file', required=False)
+@click.option('--profile-items', type=click.INT, default=profile_items,
+              help='Dump the cProfile data of the N slowest items of each file (0 = disabled)', required=False)
+@click.option('--profile-dir', type=click.STRING, default=profile_dir,
+              help='Directory of the cProfile dumps', required=False)
 @with_appcontext
 def collectionpublisher(
             collection: str,
             input_json: str,
             log_level:str,
             directory= None,
-            authenticate = False
+            authenticate = False,
+            asset_workers = 1,
+            workers = 1,
+            batch_size = 0,
+            preload_items = False,
+            checksum_cache = None,
+            rehash = False,
+            footprint_mode = 'fast',
+            footprint_tolerance = 8,
+            manifest_workers = 1,
+            watch = False,
+            poll_interval = 5.0,
+            coordinate = False,
+            lease_seconds = 300,
+            preflight = False,
+            dry_run = False,
+            journal_dir = None,
+            retry_failed = False,
+            incremental = False,
+            metrics_file = None,
+            metrics_prom = None,
+            profile_items = 0,
+            profile_dir = None
             ):
 
         if log_level:
@@ -69,20 +154,95 @@ def collectionpublisher(
         else:
             basicConfig(level='INFO')
 
-        if directory: #Procura mais arquivos '.json' numa árvore de diretórios
-            for filepath in Path(directory).rglob("*.json"):
-                if filepath.is_dir():
+        configure_checksum_cache(checksum_cache, max_entries=checksum_cache_size, rehash=rehash)
+        configure_footprint(footprint_mode, footprint_tolerance)
+        configure_metrics(metrics_file, metrics_prom, profile_items, profile_dir)
+
+        catalog = CatalogCache()
+
+        coordinator = None
+        if coordinate and not dry_run:
+            coordinator = Coordinator(db.engine, lease_seconds, directory)
+            coordinator.create_table()
+            info(f'Coordination enabled, publisher {coordinator.owner}.')
+
+        options = dict(asset_workers=asset_workers, workers=workers, batch_size=batch_size,
+                       preload_items=preload_items, catalog=catalog, journal_dir=journal_dir,
+                       retry_failed=retry_failed, preflight=preflight, incremental=incremental)
+
+        # The outputs of the publisher (journals, logs, pre-flight reports, metrics) are never read as manifests
+        exclude = {os.path.abspath(path) for path in (dir_file_processed, dir_file_failed, logpath, journal_dir,
+                                                      metrics_file, metrics_prom, profile_dir) if path}
+
+        if watch:
+            if not directory:
+                raise click.UsageError('--watch requires --directory.')
+            if dry_run:
+                raise click.UsageError('--dry-run can not be used with --watch.')
+
+            # The app context, the database connections and the caches are reused by every file
+            install_signal_handlers()
+            for filejson in watch_manifests(directory, poll_interval, exclude=exclude):
+                if not os.path.exists(filejson):
                     continue
-                fileslist.append(filepath)
+                try:
+                    publish_manifest(collection, filejson, authenticate, coordinator, stop_event=shutdown, **options)
+                except SQLAlchemyError:
+                    # Database errors are not caused by the file: it is kept and processed again on the next start
+                    db.session.rollback()
+                    error(f'Database error processing the file {filejson}, it was kept! {traceback.format_exc()}')
+                except Exception:
+                    # A file that breaks the publisher (e.g. an item without "name") is set aside, so the
+                    # daemon keeps watching and is not stopped by it again after a restart
+                    error(f'Error processing the file {filejson}, it was moved to {dir_file_failed}! '
+                          f'{traceback.format_exc()}')
+                    if os.path.exists(filejson):
+                        move_failed(filejson)
+            info('Shutdown requested, the watch mode was stopped.')
+            return
+
+        if directory and not dry_run:
+            # The process pools are forked: a fork from the manifest threads may copy a lock
+            # (logging, GDAL, SQLAlchemy pool) held by another thread and deadlock the worker
+            if manifest_workers > 1 and workers > 1:
+                raise click.UsageError('--manifest-workers and --workers can not both be greater than 1.')
+
+            # The manifests are run by priority (collection, age, size), several at a time
+            app = current_app._get_current_object()
+
+            def _publish(filejson: str):
+                if manifest_workers <= 1:
+                    publish_manifest(collection, filejson, authenticate, coordinator, **options)
+                    return
+                # Each manifest thread has its own app context (database session) and catalog cache
+                with app.app_context():
+                    publish_manifest(collection, filejson, authenticate, coordinator,
+                                     **dict(options, catalog=CatalogCache()))
+
+            try:
+                scheduler = Scheduler(_publish, manifest_workers, schedule_order, collection_priorities,
+                                      collection_limits)
+            except ValueError as e:
+                raise click.UsageError(str(e))
+
+            for filepath in sorted(scan_manifests(directory, exclude)):
+                scheduler.add(filepath, manifest_collection(filepath, collection))
+
+            scheduler.run_all()
+            return
+
+        if directory: #Procura mais arquivos '.json' numa árvore de diretórios
+            fileslist.extend(sorted(scan_manifests(directory, exclude)))
         else:
             fileslist.append(input_json)
 
         for filejson in fileslist:
-            if os.path.exists(filejson): #input_json
-                process_file(collection, filejson, authenticate)
+            if os.path.exists(filejson) and dry_run:
+                preflight_file(filejson)
+            elif os.path.exists(filejson): #input_json
+                publish_manifest(collection, filejson, authenticate, coordinator, **options)
             else:
                 warning("The file does not exist.")
-                logList.append("The file does not exist.")
 
 def guess_mime_type(extension: str, cog=False) -> Optional[str]:
     """Try to identify file mimetype."""
@@ -127,6 +287,132 @@ def collection_by_identifier(collection_name) -> Collection:
         .filter(func.concat(Collection.name, '-', Collection.version) == collection_name) \
         .first_or_404(f'Collection {collection_name} not found.')
 
+def existing_items(collection: Collection) -> set:
+    """Load the names of the items already published in a collection.
+
+    The names are read with a single streaming query, so the whole collection
+    is checked without one SELECT per item.
+
+    Returns:
+        set with the item names
+    """
+    query = (
+        db.session.query(Item.name)
+        .filter(Item.collection_id == collection.id)
+        .yield_per(10000)
+    )
+    return {name for name, in query}
+
+def stored_item(collection: Collection, item_name: str) -> Optional[dict]:
+    """Load the stored values of an item compared by the incremental reprocess.
+
+    Returns:
+        dict with the item id, name, assets and the compared columns, or None when the item is not published
+    """
+    row = (
+        db.session.query(Item.id, Item.name, Item.assets, Item.cloud_cover, Item.start_date, Item.end_date,
+                         Item.tile_id, Item.srid, Item.is_available)
+        .filter(Item.collection_id == collection.id, Item.name == item_name)
+        .first()
+    )
+    if row is None:
+        return None
+
+    stored = row._asdict()
+    stored['assets'] = stored['assets'] or dict()
+    return stored
+
+class CatalogCache:
+    """Cache of the catalog lookups made during a run.
+
+    Collections are resolved once per identifier. The first time a tile is requested
+    for a collection, the tile name -> id map of the collection grid is loaded with a
+    single query and cached by (grid id, tile name); a tile missing from the map (e.g.
+    created during the run, or of a collection without grid) is looked up and cached on miss.
+    The names of the items already published are loaded once per collection and run, see
+    `existing_items`, and the items saved afterwards are added to them.
+    The extent of the items saved in each collection is kept until `update_extents`.
+    """
+
+    def __init__(self):
+        self.collections = dict()
+        self.grids = dict()
+        self.tiles = dict()
+        self.items = dict()
+        self.extents = dict()
+
+    def collection(self, identifier: str) -> Collection:
+        """Get a collection by its identifier (name-version)."""
+        if identifier not in self.collections:
+            self.collections[identifier] = collection_by_identifier(identifier)
+        return self.collections[identifier]
+
+    def tile_id(self, collection: Collection, tile_name: str) -> Optional[int]:
+        """Get the id of a tile of the collection grid by its name, or None when the tile does not exist.
+
+        Tile names are only unique within a grid, so the tiles are cached by (grid id, name).
+        """
+        grid_id = collection.grid_ref_sys_id
+        if grid_id is not None and grid_id not in self.grids:
+            tiles = (
+                db.session.query(Tile.name, Tile.id)
+                .filter(Tile.grid_ref_sys_id == grid_id)
+                .all()
+            )
+            self.grids[grid_id] = True
+            self.tiles.update({(grid_id, name): tile_id for name, tile_id in tiles})
+            debug(f"{len(tiles)} tiles of the grid {grid_id} loaded.")
+
+        key = (grid_id, tile_name)
+        if key not in self.tiles:
+            query = Tile.query().filter(Tile.name == tile_name)
+            if grid_id is not None:
+                query = query.filter(Tile.grid_ref_sys_id == grid_id)
+            tile = query.first()
+            self.tiles[key] = tile.id if tile is not None else None
+
+        return self.tiles[key]
+
+    def existing_items(self, collection: Collection) -> set:
+        """Get the names of the items already published in a collection, see `existing_items`."""
+        if collection.id not in self.items:
+            self.items[collection.id] = existing_items(collection)
+            info(f"{len(self.items[collection.id])} items already published in the collection {collection.identifier}.")
+        return self.items[collection.id]
+
+    def track_item(self, collection: Collection, item_name: str, start_date: str, end_date: str, metadata: dict):
+        """Fold a saved item in the extent of its collection, see `extent.CollectionExtent`.
+
+        The item is also added to the names loaded by `existing_items`, so the next files
+        of the run skip it without loading the collection again.
+        """
+        if collection.id in self.items:
+            self.items[collection.id].add(item_name)
+
+        bbox = metadata.get('bbox')
+        extent = self.extents.setdefault(collection.id, CollectionExtent())
+        extent.add(datetime.strptime(start_date, '%Y-%m-%dT%H:%M:%S'), datetime.strptime(end_date, '%Y-%m-%dT%H:%M:%S'),
+                   bbox.bounds if bbox is not None else None)
+
+    def update_extents(self):
+        """Widen the extent of the collections with the items saved since the last update, one UPDATE per collection."""
+        extents, self.extents = self.extents, dict()
+        table = Collection.__table__
+
+        for collection_id, extent in extents.items():
+            statement = extent.statement(table, collection_id)
+            if statement is None:
+                continue
+            try:
+                db.session.execute(statement)
+                db.session.commit()
+            except:
+                db.session.rollback()
+                error(f"Sorry, we were unable to update the extent of the collection {collection_id}! {traceback.format_exc()}")
+                continue
+            info(f"Extent of the collection {collection_id} updated with {extent.items} items "
+                 f"({extent.start_date} - {extent.end_date}).")
+
 def epsg_srid(file_path: str) -> int:
     """Get the Authority Code from a data set path.
 
@@ -135,22 +421,8 @@ def epsg_srid(file_path: str) -> int:
 
     When no code found, returns None.
     """
-    with rasterio.open(str(file_path)) as ds:
-        crs = ds.crs
-
-    if crs is not None:
-        srid = crs.to_epsg()
-        if srid is not None:
-            return srid
-
-    ref = osr.SpatialReference()
-    ds = gdal.Open(str(file_path))
-    wkt = ds.GetProjection()
-
-    ref.ImportFromWkt(wkt)
-
-    code = ref.GetAuthorityCode(None)
-    return int(code) if str(code).isnumeric() else None
+    with probe_raster(file_path) as probe:
+        return probe.epsg
 
 def create_asset(href: str,
                  mime_type: str,
@@ -177,11 +449,11 @@ def create_asset(href: str,
 
     debug("Checking if the file exists...")
 
-    file_size = os.stat(absolute_path).st_size
+    stat = os.stat(absolute_path)
+    file_size = stat.st_size
 
     if file_size is None:
         info(f"The file {absolute_path}, not found in the directory.")
-        logList.append(f"The file {absolute_path}, not found in the directory.")
 
     if created is None:
         created = _now_str
@@ -190,11 +462,14 @@ def create_asset(href: str,
 
     debug("Processing the checksum:multihash")
 
+    with stage('checksum'):
+        checksum = multihash_checksum(str(absolute_path), stat)
+
     asset = {
         'href': str(href),
         'type': mime_type,
         'bdc:size': file_size,
-        'checksum:multihash': multihash_checksum_sha256(str(absolute_path)),
+        'checksum:multihash': checksum,
         'roles': role,
         'created': created,
         'updated': _now_str
@@ -205,212 +480,727 @@ def create_asset(href: str,
 
     try:
         if is_raster:
-            with rasterio.open(str(absolute_path)) as data_set:
+            with stage('asset_probe'), probe_raster(absolute_path) as probe:
                 asset['bdc:raster_size'] = dict(
-                    x=data_set.shape[1],
-                    y=data_set.shape[0],
+                    x=probe.shape[1],
+                    y=probe.shape[0],
                 )
 
-                chunk_x, chunk_y = data_set.profile.get('blockxsize'), data_set.profile.get('blockxsize')
+                chunk_x, chunk_y = probe.block_size
 
-                if chunk_x is None or chunk_x is None:
+                if chunk_x is None or chunk_y is None:
                     return asset
 
                 asset['bdc:chunk_size'] = dict(x=chunk_x, y=chunk_y)
     except:
         error("Sorry, error opening image file!")
-        logList.append("Sorry, error opening image file!")
         return
 
     debug("Done!!")
 
     return asset
 
-def create_item(collection: Collection,
-                reprocess: bool,
-                cloud_cover: float,
-                tile_id: str,
-                item_name: str,
-                start_date: datetime,
-                end_date: datetime,
-                assets_dict: dict
-                ) -> bool:
-
-    info(f'Item: {item_name}...')
-    logList.append(f'Item: {item_name}...')
+def asset_jobs(assets_dict: dict) -> list:
+    """Map the assets of a manifest item to `create_asset` arguments.
 
-    assets = dict()
-
-    file_tci = ''
+    Args:
+        assets_dict - Assets of the item as read from the .json file
+    Returns:
+        list of (asset key, create_asset kwargs), in the manifest order
+    """
+    jobs = []
 
     mime_type_png = 'image/png'
     r = re.compile(prefixo)
 
-    with current_app._get_current_object().app_context():
+    for key in assets_dict.keys():
+        if (key=="thumbnail") | (key=="PVI"):
+            href_pvi = prefixo_data + (r.sub('',assets_dict[key]))
+            file_pvi = assets_dict[key]
+            jobs.append(("thumbnail", dict(href=str(href_pvi), mime_type=mime_type_png,
+                                           role=['thumbnail'], absolute_path=str(file_pvi))))
+        elif (key in assert_list_image) | ("BAND" in key):
+            href_tci = prefixo_data + (r.sub('',assets_dict[key]))
+            file_tci = assets_dict[key]
+            mini_type_file = guess_mime_type(assets_dict[key])
+            jobs.append((key, dict(href=str(href_tci), mime_type=mini_type_file,
+                                   role=['data'], absolute_path=file_tci, is_raster=True)))
+        elif (key in assert_list_files):
+            href_file = prefixo_data + (r.sub('',assets_dict[key]))
+            file_extra = assets_dict[key]
+            mini_type_file = guess_mime_type(assets_dict[key])
+            jobs.append((key, dict(href=str(href_file), mime_type=mini_type_file,
+                                   role=['file'], absolute_path=file_extra)))
+        else:
+            error(f"Sorry, invalid key! {key}")
 
-        if tile_id is not None:
-            tile = Tile.query().filter(
-            Tile.name == tile_id,
-            ).first()
+    return jobs
 
-        # Let's create a new Item definition
-        with db.session.begin_nested():
-            item = (
-                Item.query()
-                .filter(Item.name == item_name,
-                        Item.collection_id == collection.id)
-                .first()
-            )
-            if item is None:
-                info(f'Creating a new Item in database. Item: {item_name}.')
-                logList.append(f'Creating a new Item in database. Item: {item_name}.')
-                try:
-                    item = Item(collection_id=collection.id, name=item_name)
-                    debug("Done!")
-                except:
-                    error("Sorry, we were unable to create the item to the database")
-                    logList.append("Sorry, we were unable to create the item to the database")
-                    return False
-            else:
-                if reprocess:
-                    try:
-                        where = dict(name=item_name, collection_id=collection.id)
-                        item, created = get_or_create_model(Item, defaults=item, **where)
-                        info(f"Item {item_name} was modified, will be updated.")
-                        logList.append(f"Item {item_name} was modified, will be updated.")
-                    except:
-                        error('It was not possible to update the data in the database.')
-                        logList.append('It was not possible to update the data in the database.')
-                        return False
-                else:
-                    warning('Image metadata is already in the database.')
-                    logList.append('Image metadata is already in the database.')
-                    return False
+def reference_band(jobs: list) -> Optional[str]:
+    """Choose the reference band of an item: its srid and geometries are used for the whole item.
+
+    The first data asset listed in ``reference_bands`` is chosen, else the first data asset in key order.
+
+    Args:
+        jobs - list of (asset key, create_asset kwargs), see `asset_jobs`
+    Returns:
+        str key of the reference band, or None when the item has no data asset
+    """
+    data = [key for key, kwargs in jobs if kwargs['role'] == ['data']]
+
+    for key in reference_bands:
+        if key in data:
+            return key
+
+    return min(data) if data else None
 
+def create_assets(jobs: list, asset_workers: int = 1) -> Optional[dict]:
+    """Create the assets of an item.
+
+    When ``asset_workers`` is greater than 1, the assets are prepared concurrently
+    in a bounded thread pool (checksum and raster reads release the GIL). The assets
+    dict is always assembled in the order of ``jobs``.
+
+    Args:
+        jobs - list of (asset key, create_asset kwargs), see `asset_jobs`
+        asset_workers - Number of threads used to prepare the assets
+    Returns:
+        dict with the assets or None when an asset could not be created
+    """
+    futures = None
+
+    if asset_workers > 1 and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=min(asset_workers, len(jobs))) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, create_asset, **kwargs)
+                       for _, kwargs in jobs]
+
+    assets = dict()
+    failed = False
+
+    for index, (key, kwargs) in enumerate(jobs):
         try:
-            # Pre-compute metadata
-            for key in assets_dict.keys():
-                if (key=="thumbnail") | (key=="PVI"):
-                    href_pvi = prefixo_data + (r.sub('',assets_dict[key]))
-                    file_pvi = assets_dict[key]
-                    assets["thumbnail"] = create_asset(href=str(href_pvi), mime_type=mime_type_png,
-                                            role=['thumbnail'], absolute_path=str(file_pvi))
-                elif (key in assert_list_image) | ("BAND" in key):
-                    href_tci = prefixo_data + (r.sub('',assets_dict[key]))
-                    file_tci = assets_dict[key]
-                    mini_type_file = guess_mime_type(assets_dict[key])
-                    assets[key] = create_asset(href=str(href_tci), mime_type=mini_type_file,
-                                        role=['data'], absolute_path=file_tci, is_raster=True)
-                elif (key in assert_list_files):
-                    href_file = prefixo_data + (r.sub('',assets_dict[key]))
-                    file_extra = assets_dict[key]
-                    mini_type_file = guess_mime_type(assets_dict[key])
-                    assets[key] = create_asset(href=str(href_file), mime_type=mini_type_file,
-                                        role=['file'], absolute_path=file_extra)
-                else:
-                    error(f"Sorry, invalid key! {key}")
-                    logList.append(f"Sorry, invalid key! {key}")
-                        
+            if futures is None:
+                assets[key] = create_asset(**kwargs)
+            else:
+                assets[key] = futures[index].result()
         except:
             error("Sorry, we were unable to create the Assets to the item! {}".format(traceback.format_exc()))
-            logList.append("Sorry, we were unable to create the Assets to the item! {}".format(traceback.format_exc()))
-            return False
+            if futures is None:
+                return None
+            failed = True
+
+    return None if failed else assets
+
+def lookup_item(collection: Collection, reprocess: bool, item_name: str) -> Optional[Item]:
+    """Get the Item to be published.
+
+    Args:
+        collection - Collection of the item
+        reprocess - Flag to update an item already in the database
+        item_name - Item name
+    Returns:
+        Item instance or None when the item must not be published
+    """
+    with stage('db_lookup'), db.session.begin_nested():
+        item = (
+            Item.query()
+            .filter(Item.name == item_name,
+                    Item.collection_id == collection.id)
+            .first()
+        )
+        if item is None:
+            info(f'Creating a new Item in database. Item: {item_name}.')
+            try:
+                item = Item(collection_id=collection.id, name=item_name)
+                debug("Done!")
+            except:
+                error("Sorry, we were unable to create the item to the database")
+                return None
+        else:
+            if reprocess:
+                try:
+                    where = dict(name=item_name, collection_id=collection.id)
+                    item, created = get_or_create_model(Item, defaults=item, **where)
+                    info(f"Item {item_name} was modified, will be updated.")
+                except:
+                    error('It was not possible to update the data in the database.')
+                    return None
+            else:
+                warning('Image metadata is already in the database.')
+                timer = current_timer()
+                if timer is not None:
+                    timer.status = 'skipped'
+                return None
 
-        debug("Saving to the database...")
+    return item
 
-        item.assets = assets
-        item.cloud_cover = cloud_cover
-        item.start_date = datetime.strptime(start_date,'%Y-%m-%dT%H:%M:%S')
-        item.end_date = datetime.strptime(end_date,'%Y-%m-%dT%H:%M:%S')
+def prepare_item(collection_identifier: str,
+                 item_name: str,
+                 assets_dict: dict,
+                 asset_workers: int = 1,
+                 stored_assets: Optional[dict] = None,
+                 tile: Optional[str] = None
+                 ) -> Optional[dict]:
+    """Compute the metadata of an item: assets, srid and geometries.
 
-        if (collection.identifier in goes_collections):
-            if file_tci:
-                nc = Dataset(file_tci)
-                # Extent
-                llx = nc.variables['geospatial_lat_lon_extent'].geospatial_westbound_longitude
-                lly = nc.variables['geospatial_lat_lon_extent'].geospatial_southbound_latitude
-                urx = nc.variables['geospatial_lat_lon_extent'].geospatial_eastbound_longitude
-                ury = nc.variables['geospatial_lat_lon_extent'].geospatial_northbound_latitude
-                boxer = str(llx) + ',' + str(lly) + ',' + str(urx) + ',' + str(ury)
-                bboxer = parse_bbox(boxer)
+    This function does not access the database, so it may run in a worker process.
 
-        item.srid = epsg_srid(str(file_tci))
-        if tile_id is not None:
-                item.tile_id = tile.id
+    Args:
+        collection_identifier - Collection identifier (name-version)
+        item_name - Item name
+        assets_dict - Assets of the item as read from the .json file
+        asset_workers - Number of threads used to prepare the assets
+        stored_assets - Assets of the stored item (incremental reprocess). The assets whose file
+            did not change are reused, and the geometries are only computed when the reference band changed.
+        tile - Tile of the item. The geometries of the items of a tile are reused, see `grid.cached_geometry`.
+    Returns:
+        dict with the keys ``assets``, ``srid``, ``geom``, ``footprint``, ``bbox`` and ``geometry``
+        (False when the geometries were not computed) or None when the metadata could not be computed
+    """
+    # Pre-compute metadata
+    try:
+        jobs = asset_jobs(assets_dict)
+    except:
+        error("Sorry, we were unable to create the Assets to the item! {}".format(traceback.format_exc()))
+        return None
+
+    reference_key = reference_band(jobs)
+    file_tci = dict(jobs)[reference_key]['absolute_path'] if reference_key is not None else ''
+
+    reused = dict()
+    if stored_assets is not None:
+        reused = reusable_assets(jobs, stored_assets)
+        debug(f"{len(reused)} of {len(jobs)} assets of the item {item_name} did not change.")
+
+    # The rasters are opened once and shared by the assets, srid, extent and footprint steps
+    with probe_scope():
+        created = create_assets([job for job in jobs if job[0] not in reused], asset_workers)
+        if created is None:
+            return None
+
+        assets = dict()
+        for key, _ in jobs:
+            if key in reused:
+                assets[key] = reused[key]
+            elif stored_assets is not None and same_asset(stored_assets.get(key), created[key]):
+                # Same file contents (e.g. only touched): keep the stored asset and its dates
+                assets[key] = stored_assets[key]
+            else:
+                assets[key] = created[key]
+
+        metadata = dict(assets=assets, srid=None, geom=None, footprint=None, bbox=None, geometry=True)
 
-        debug("Done!")
+        reference = assets.get(reference_key)
+        if stored_assets is not None and reference is not None and reference is stored_assets.get(reference_key):
+            # The reference band did not change: the stored srid and geometries are kept
+            metadata['geometry'] = False
+            return metadata
 
         try:
-            debug("Processing raster_extent...")
-            if (collection.identifier in goes_collections):
-                item.footprint = item.bbox = geom_to_wkb(bboxer.envelope)
+            if (collection_identifier in goes_collections):
+                # Extent and grid read in the NetCDF open shared with the assets; srid and bbox cached per grid
+                with stage('netcdf'):
+                    metadata['srid'], metadata['bbox'] = goes_metadata(str(file_tci))
             else:
-                item.geom = from_shape(raster_extent(str(file_tci)))
-                debug("Done!")
-                debug("Processing footprint...")
-                footprint, bbox = get_footprint(file_tci)
-                item.footprint = func.ST_SetSRID(func.ST_MakeEnvelope(*footprint), 4326)
-                debug("Done!")
-                debug("Processing image box...")
-                item.bbox = geom_to_wkb(bbox.envelope, srid=4326)
-                debug("Done!")
+                # The items of a tile share the grid: the geometries cached for the tile are reused
+                signature, cached = None, dict()
+                if tile is not None:
+                    signature = grid_signature(str(file_tci))
+                    cached = cached_geometry(collection_identifier, tile, signature)
+
+                if 'srid' in cached:
+                    metadata['srid'], metadata['geom'] = cached['srid'], cached['geom']
+                else:
+                    with stage('srid'):
+                        metadata['srid'] = epsg_srid(str(file_tci))
+
+                    debug("Processing raster_extent...")
+                    with stage('extent'):
+                        metadata['geom'] = raster_extent(str(file_tci))
+                    debug("Done!")
+
+                if 'footprint' in cached:
+                    metadata['footprint'], metadata['bbox'] = cached['footprint'], cached['bbox']
+                else:
+                    debug("Processing footprint...")
+                    with stage('footprint'):
+                        metadata['footprint'], bbox = get_footprint(file_tci)
+                    debug("Done!")
+                    debug("Processing image box...")
+                    metadata['bbox'] = bbox.envelope
+                    debug("Done!")
+
+                if signature is not None and not cached:
+                    cache_geometry(collection_identifier, tile, signature, metadata['srid'], metadata['geom'],
+                                   metadata['footprint'], metadata['bbox'])
         except:
             error("Error in footprint generation or area of ​​interest generation!")
-            logList.append("Error in footprint generation or area of ​​interest generation!")
+            return None
+
+    return metadata
+
+def item_columns(metadata: dict, cloud_cover: float, start_date: str, end_date: str) -> dict:
+    """Build the Item column values from the metadata computed by `prepare_item`.
+
+    The srid and the geometries are left out when they were not computed (incremental reprocess).
+    """
+    from bdc_catalog.utils import geom_to_wkb
+    from geoalchemy2.shape import from_shape
+
+    columns = dict(
+        assets=metadata['assets'],
+        cloud_cover=cloud_cover,
+        start_date=datetime.strptime(start_date,'%Y-%m-%dT%H:%M:%S'),
+        end_date=datetime.strptime(end_date,'%Y-%m-%dT%H:%M:%S'),
+    )
+
+    if metadata.get('geometry', True):
+        columns['srid'] = metadata['srid']
+
+        if metadata['footprint'] is None:
+            columns['footprint'] = columns['bbox'] = geom_to_wkb(metadata['bbox'])
+        else:
+            columns['geom'] = from_shape(metadata['geom'])
+            columns['footprint'] = func.ST_SetSRID(func.ST_MakeEnvelope(*metadata['footprint']), 4326)
+            columns['bbox'] = geom_to_wkb(metadata['bbox'], srid=4326)
+
+    columns['is_available'] = True
+
+    return columns
+
+def save_item(collection: Collection,
+              item: Item,
+              reprocess: bool,
+              cloud_cover: float,
+              tile_id: str,
+              start_date: datetime,
+              end_date: datetime,
+              metadata: dict,
+              catalog: CatalogCache
+              ) -> bool:
+    """Fill out the Item with the metadata computed by `prepare_item` and save it.
+
+    Returns:
+        bool True when the item was saved
+    """
+    item_name = item.name
+
+    debug("Saving to the database...")
+
+    columns = item_columns(metadata, cloud_cover, start_date, end_date)
+    if tile_id is not None:
+        columns['tile_id'] = catalog.tile_id(collection, tile_id)
+        if columns['tile_id'] is None:
+            error(f"Sorry, the tile {tile_id} was not found in the database!")
             return False
 
-        item.is_available = True
+    for column, value in columns.items():
+        setattr(item, column, value)
 
-        debug("Saving the item to the database...")
+    debug("Saving the item to the database...")
 
-        try:
+    try:
+        with stage('db_save'):
             if not reprocess:
                 item.save()
             else:
                 item.updated = datetime.utcnow()
                 item.save()
                 info(f'Item {item_name} with ID:{item.id} was updated in dababase!')
-                logList.append(f'Item {item_name} with ID:{item.id} was updated in dababase!')
-        except:
-            error("Sorry, we were unable to save the item to the database!")
-            logList.append("Sorry, we were unable to save the item to the database!")
-            return False
+    except:
+        error("Sorry, we were unable to save the item to the database!")
+        return False
+
+    info(f'New Item {item_name} with ID:{item.id} was saved in dababase!')
+
+    catalog.track_item(collection, item_name, start_date, end_date, metadata)
+
+    return True
+
+def item_changes(collection: Collection,
+                 stored: dict,
+                 cloud_cover: float,
+                 tile_id: str,
+                 start_date: str,
+                 end_date: str,
+                 metadata: dict,
+                 catalog: CatalogCache
+                 ) -> dict:
+    """Get the columns of a reprocessed item that differ from the stored item, see `incremental.changed_columns`.
+
+    Raises:
+        ValueError when the tile of the item is not found
+    """
+    columns = item_columns(metadata, cloud_cover, start_date, end_date)
+    if tile_id is not None:
+        columns['tile_id'] = catalog.tile_id(collection, tile_id)
+        if columns['tile_id'] is None:
+            raise ValueError(f"Tile {tile_id} not found.")
+
+    return changed_columns(stored, columns)
+
+def update_item(stored: dict, columns: dict):
+    """Write the changed columns of an item, without committing."""
+    db.session.execute(
+        update(Item.__table__)
+        .where(Item.__table__.c.id == stored['id'])
+        .values(updated=datetime.utcnow(), **columns)
+    )
+
+def save_item_changes(collection: Collection,
+                      stored: dict,
+                      cloud_cover: float,
+                      tile_id: str,
+                      start_date: str,
+                      end_date: str,
+                      metadata: dict,
+                      catalog: CatalogCache
+                      ) -> bool:
+    """Save a reprocessed item with an UPDATE of the columns that changed (incremental reprocess).
+
+    An item without changes is not written and its outcome is ``skipped``.
 
-        info(f'New Item {item_name} with ID:{item.id} was saved in dababase!')
-        logList.append(f'New Item {item_name} with ID:{item.id} was saved in dababase!')
+    Returns:
+        bool True when the item was saved or did not change
+    """
+    item_name = stored['name']
+
+    try:
+        columns = item_changes(collection, stored, cloud_cover, tile_id, start_date, end_date, metadata, catalog)
+    except ValueError:
+        error(f"Sorry, the tile {tile_id} was not found in the database!")
+        return False
+
+    if not columns:
+        info(f'Item {item_name} with ID:{stored["id"]} did not change, it was not updated.')
+        timer = current_timer()
+        if timer is not None:
+            timer.status = 'skipped'
+        return True
+
+    try:
+        with stage('db_save'):
+            update_item(stored, columns)
+            db.session.commit()
+    except:
+        db.session.rollback()
+        error("Sorry, we were unable to save the item to the database!")
+        return False
+
+    info(f'Item {item_name} with ID:{stored["id"]} was updated in dababase! Columns: {", ".join(columns)}.')
+
+    catalog.track_item(collection, item_name, start_date, end_date, metadata)
 
     return True
 
-def get_footprint(imagepath: str, epsg = 'EPSG:4326') -> tuple:
-    """Get image footprint
+def finish_item(timer: ItemTimer, journal: Optional[Journal] = None):
+    """Record the timings and the outcome of an item, once it is committed."""
+    record(timer)
+    if journal is not None:
+        journal.add(timer.name, timer.status, timer.collection)
+
+class BulkWriter:
+    """Write prepared items to the database in batches.
+
+    Each batch is written in a single transaction with ``INSERT ... ON CONFLICT (collection_id, name)``:
+    new items are inserted, items flagged with ``reprocess`` are updated and the other items
+    already in the database are left untouched. The items reprocessed incrementally (with the
+    ``stored`` item) are saved with an UPDATE of the columns that changed. When a batch fails,
+    its items are written one by one, so a bad item does not discard the rest of the batch.
 
     Args:
-        imagepath (str): Image file
-        epsg (str): Image's EPSG
+        catalog - Catalog cache used to resolve the tiles
+        batch_size - Number of items written per transaction
+        journal - Journal where the outcome of the items is recorded once the batch is committed
+    """
+
+    def __init__(self, catalog: CatalogCache, batch_size: int, journal: Optional[Journal] = None):
+        self.catalog = catalog
+        self.batch_size = batch_size
+        self.journal = journal
+        self.pending = []
+        self.publish_fail = []
+
+    def add(self, entry: dict, metadata: Optional[dict], timer: Optional[ItemTimer] = None):
+        """Queue an item with the metadata computed by `prepare_item`.
+
+        The timer of the item is recorded once the item is written;
+        each item of a batch is charged an equal share of the batch write.
+        """
+        if timer is None:
+            timer = ItemTimer(entry['collection'].identifier, entry['name'])
+
+        if metadata is None:
+            self.publish_fail.append(entry['name'])
+            timer.status = 'failed'
+            finish_item(timer, self.journal)
+            return
+
+        self.pending.append((entry, metadata, timer))
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the queued items to the database."""
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, []
+
+        debug(f"Saving a batch of {len(batch)} items to the database...")
+
+        start = time.perf_counter()
+        try:
+            saved = self._write(batch)
+            db.session.commit()
+        except:
+            db.session.rollback()
+            error(f"Sorry, we were unable to save a batch of {len(batch)} items, saving them one by one! {traceback.format_exc()}")
+
+            saved = dict()
+            for entry, metadata, timer in batch:
+                try:
+                    saved.update(self._write([(entry, metadata, timer)]))
+                    db.session.commit()
+                except:
+                    db.session.rollback()
+                    timer.status = 'failed'
+                    error(f"Sorry, we were unable to save the item {entry['name']} to the database! {traceback.format_exc()}")
+        share = (time.perf_counter() - start) / len(batch)
+
+        for entry, _, timer in batch:
+            item_name = entry['name']
+            timer.add('db_save', share)
+            timer.elapsed += share
+            if item_name not in saved and timer.status == 'ok':
+                # Not inserted by ON CONFLICT DO NOTHING: the item is already in the database
+                timer.status = 'failed' if entry['reprocess'] else 'skipped'
+            record(timer)
+
+        if self.journal is not None:
+            self.journal.extend((timer.name, timer.status, timer.collection) for _, _, timer in batch)
+
+        for entry, metadata, timer in batch:
+            item_name = entry['name']
+            if item_name in saved and timer.status == 'ok':
+                self.catalog.track_item(entry['collection'], item_name, entry['start_date'], entry['end_date'], metadata)
+
+            if item_name not in saved:
+                if timer.status == 'skipped':
+                    warning(f'Image metadata is already in the database. Item: {item_name}.')
+                else:
+                    error(f'Item {item_name} has not been saved in the database!')
+                self.publish_fail.append(item_name)
+            elif timer.status == 'skipped':
+                info(f'Item {item_name} with ID:{saved[item_name]} did not change, it was not updated.')
+            elif entry['reprocess']:
+                info(f'Item {item_name} with ID:{saved[item_name]} was updated in dababase!')
+            else:
+                info(f'New Item {item_name} with ID:{saved[item_name]} was saved in dababase!')
+
+    def _write(self, batch: list) -> dict:
+        """Upsert the items of a batch, without committing.
+
+        Returns:
+            dict item name -> item id of the rows inserted, updated or unchanged
+        """
+        table = Item.__table__
+        saved = dict()
+
+        rows = {True: [], False: []}
+        for entry, metadata, timer in batch:
+            if entry.get('stored') is not None:
+                columns = item_changes(entry['collection'], entry['stored'], entry['cloud_cover'], entry['tile_id'],
+                                       entry['start_date'], entry['end_date'], metadata, self.catalog)
+                if columns:
+                    update_item(entry['stored'], columns)
+                else:
+                    timer.status = 'skipped'
+                saved[entry['name']] = entry['stored']['id']
+                continue
+
+            tile_id = None
+            if entry['tile_id'] is not None:
+                tile_id = self.catalog.tile_id(entry['collection'], entry['tile_id'])
+                if tile_id is None:
+                    raise ValueError(f"Tile {entry['tile_id']} not found.")
+
+            row = dict(collection_id=entry['collection'].id, name=entry['name'], geom=None, tile_id=tile_id)
+            row.update(item_columns(metadata, entry['cloud_cover'], entry['start_date'], entry['end_date']))
+            rows[bool(entry['reprocess'])].append(row)
+
+        for reprocess, values in rows.items():
+            if not values:
+                continue
+
+            statement = insert(table).values(values)
+            conflict = [table.c.collection_id, table.c.name]
+            if reprocess:
+                columns = {column: statement.excluded[column] for column in values[0].keys()
+                           if column not in ('collection_id', 'name')}
+                columns['updated'] = datetime.utcnow()
+                statement = statement.on_conflict_do_update(index_elements=conflict, set_=columns)
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=conflict)
+
+            for row in db.session.execute(statement.returning(table.c.id, table.c.name)):
+                saved[row.name] = row.id
+
+        return saved
 
-    See:
-        https://rasterio.readthedocs.io/en/latest/topics/masks.html
+def create_item(collection: Collection,
+                reprocess: bool,
+                cloud_cover: float,
+                tile_id: str,
+                item_name: str,
+                start_date: datetime,
+                end_date: datetime,
+                assets_dict: dict,
+                asset_workers: int = 1,
+                catalog: Optional[CatalogCache] = None,
+                stored: Optional[dict] = None
+                ) -> bool:
+
+    info(f'Item: {item_name}...')
+
+    with current_app._get_current_object().app_context():
+
+        if stored is not None:
+            # Incremental reprocess: only the changed assets and columns are computed and saved
+            metadata = prepare_item(collection.identifier, item_name, assets_dict, asset_workers, stored['assets'],
+                                    tile_id)
+            if metadata is None:
+                return False
+
+            return save_item_changes(collection, stored, cloud_cover, tile_id,
+                                     start_date, end_date, metadata, catalog or CatalogCache())
+
+        # Let's create a new Item definition
+        item = lookup_item(collection, reprocess, item_name)
+        if item is None:
+            return False
+
+        metadata = prepare_item(collection.identifier, item_name, assets_dict, asset_workers, tile=tile_id)
+        if metadata is None:
+            return False
+
+        return save_item(collection, item, reprocess, cloud_cover, tile_id,
+                         start_date, end_date, metadata, catalog or CatalogCache())
+
+def _prepare_item_worker(collection_identifier: str,
+                         item_name: str,
+                         assets_dict: dict,
+                         asset_workers: int,
+                         stored_assets: Optional[dict] = None,
+                         tile: Optional[str] = None
+                         ) -> tuple:
+    """Run `prepare_item` in a worker process and return its log records and timings along with the metadata."""
+    timer = ItemTimer(collection_identifier, item_name)
+    with capture_logs() as records, timer.running():
+        metadata = prepare_item(collection_identifier, item_name, assets_dict, asset_workers, stored_assets, tile)
+    return metadata, records, timer.export()
+
+def start_worker_pool(workers: int) -> ProcessPoolExecutor:
+    """Start a process pool for `prepare_item`.
+
+    The database connections are released before forking, so the workers
+    never share a connection with the writer.
     """
-    with rasterio.open(str(imagepath), driver = "GTiff") as dataset:
-        mask = dataset.dataset_mask()
+    db.session.commit()
+    db.engine.dispose()
 
-        geoms = []
-        res = {'val': []}
-        for geom, val in rasterio.features.shapes(mask, transform=dataset.transform):
+    executor = ProcessPoolExecutor(max_workers=workers)
+    # Start the workers now, before the writer opens a new connection
+    executor.submit(os.getpid).result()
 
-            geom = rasterio.warp.transform_geom(dataset.crs, epsg, geom, precision=6)
+    return executor
 
-            res['val'].append(val)
+def publish_items_parallel(entries,
+                           workers: int,
+                           catalog: CatalogCache,
+                           publish_fail: list,
+                           asset_workers: int = 1,
+                           writer: Optional[BulkWriter] = None,
+                           journal: Optional[Journal] = None
+                           ):
+    """Publish the items of a manifest using a process pool.
 
-            geoms.append(shapely.geometry.shape(geom))
+    The metadata of the items (checksums, footprints, ...) is computed by ``workers``
+    processes, while this process looks the items up and saves them in the manifest order.
+
+    Args:
+        entries - iterable of items, as yielded by `manifest_entries`
+        workers - Number of worker processes
+        catalog - Catalog cache used to resolve the tiles
+        publish_fail - list with the names of the items not published
+        asset_workers - Number of threads used to prepare the assets of an item
+        writer - When set, the items are queued in this `BulkWriter` instead of saved one by one
+        journal - Journal where the outcome of the items is recorded once they are saved
+    """
+    pending = deque()
+
+    def _save_next():
+        entry, item, timer, future = pending.popleft()
+        try:
+            metadata, log_entries, timings = future.result()
+        except:
+            metadata, log_entries, timings = None, [], None
+            error("Sorry, we were unable to create the Assets to the item! {}".format(traceback.format_exc()))
+
+        replay(log_entries)
+        timer.merge(timings)
+
+        if writer is not None:
+            writer.add(entry, metadata, timer)
+            return
+
+        with timer.running():
+            if metadata is None:
+                saved = False
+            elif entry.get('stored') is not None:
+                saved = save_item_changes(entry['collection'], entry['stored'], entry['cloud_cover'], entry['tile_id'],
+                                          entry['start_date'], entry['end_date'], metadata, catalog)
+            else:
+                saved = save_item(entry['collection'], item, entry['reprocess'], entry['cloud_cover'],
+                                  entry['tile_id'], entry['start_date'], entry['end_date'], metadata, catalog)
+        if not saved:
+            timer.status = 'failed'
+            publish_fail.append(entry['name'])
+        finish_item(timer, journal)
+
+    with start_worker_pool(workers) as executor:
+        try:
+            for entry in entries:
+                info(f"Item: {entry['name']}...")
+
+                timer = ItemTimer(entry['collection'].identifier, entry['name'])
+
+                item = None
+                if writer is None and entry.get('stored') is None:
+                    with timer.running():
+                        item = lookup_item(entry['collection'], entry['reprocess'], entry['name'])
+                    if item is None:
+                        if timer.status == 'ok':
+                            timer.status = 'failed'
+                        finish_item(timer, journal)
+                        publish_fail.append(entry['name'])
+                        continue
 
-        # ToDo: Otimizar
-        df = pd.DataFrame(data = res)
-        gdf = gpd.GeoDataFrame(df, crs=epsg, geometry = geoms)
+                stored_assets = entry['stored']['assets'] if entry.get('stored') is not None else None
+                future = executor.submit(_prepare_item_worker, entry['collection'].identifier, entry['name'],
+                                         entry['assets'], asset_workers, stored_assets, entry['tile_id'])
+                pending.append((entry, item, timer, future))
 
-    return gdf.unary_union.bounds, geoms[0]
+                # Keep a bounded number of items in flight
+                while len(pending) >= workers * 2:
+                    _save_next()
+        finally:
+            # Save the items already submitted, even when reading the file fails
+            while pending:
+                _save_next()
 
-def raster_extent(imagepath: str, epsg='EPSG:4326') -> shapely.geometry.Polygon: #-> dict:
+def raster_extent(imagepath: str, epsg='EPSG:4326') -> 'shapely.geometry.Polygon': #-> dict:
     """Get raster extent in arbitrary CRS
     Args:
         imagepath (str): Path to image
@@ -418,25 +1208,12 @@ def raster_extent(imagepath: str, epsg='EPSG:4326') -> shapely.geometry.Polygon:
     Returns:
         dict: geojson-like geometry
     """
-    with rasterio.open(str(imagepath)) as dataset:
-        _geom = shapely.geometry.mapping(shapely.geometry.box(*dataset.bounds))
-        return shapely.geometry.shape(rasterio.warp.transform_geom(dataset.crs, epsg, _geom, precision=6))
+    import rasterio.warp
+    import shapely.geometry
 
-def write_log():
-    try:
-        if not os.path.isdir(logpath):
-            os.mkdir(logpath)
-
-        fmt = '%Y%m%dT%H%M%S'
-        _now_str = datetime.now().strftime(fmt)
-        logpath1 = logpath + "/log_" + _now_str + ".log"
-
-        with open(logpath1, 'a+') as f:
-            f.write('\n'.join(logList))
-        f.close()
-    except:
-        error('Error when trying to create the "./log" directory!')
-        logList.append('Error when trying to create the "./log" directory!')
+    with probe_raster(imagepath) as probe:
+        _geom = shapely.geometry.mapping(shapely.geometry.box(*probe.bounds))
+        return shapely.geometry.shape(rasterio.warp.transform_geom(probe.crs, epsg, _geom, precision=6))
 
 def authenticity(name:str, collection:str)->bool:
 
@@ -473,11 +1250,12 @@ def authenticity(name:str, collection:str)->bool:
     return True
 
 def parse_bbox(value: Any):
+        import shapely.geometry
+
         fragments = value.split(',')
 
         if len(fragments) != 4:
             error(f'{value!r} is not a valid bbox. [xmin, ymin, xmax, ymax]')
-            logList.append(f'{value!r} is not a valid bbox. [xmin, ymin, xmax, ymax]')
 
         try:
             xmin, ymin, xmax, ymax = [float(elm) for elm in fragments]
@@ -485,129 +1263,392 @@ def parse_bbox(value: Any):
             return shapely.geometry.box(xmin, ymin, xmax, ymax)
         except ValueError:
             error(f'{fragments} has invalid float type')
-            logList.append(f'{fragments} has invalid float type')
 
-def process_file(collection1:str, filename:str, authenticate:bool):
+def progress(count: int, total: Optional[int]) -> str:
+    """Progress label of an item, e.g. ``[3/10]`` or ``[3]`` when the total is unknown."""
+    return f"[{count}/{total}]" if total is not None else f"[{count}]"
+
+def manifest_entries(data: Iterable[dict], collection1: str, authenticate: bool, publish_fail: list,
+                     catalog: CatalogCache, preload_items: bool = False, journal: Optional[Journal] = None,
+                     rejected: Optional[dict] = None, incremental: bool = False):
+    """Iterate over the items of a manifest.
+
+    An item may set the key ``collection`` to be published in a collection other than
+    the one given in the command line. Items of an unknown collection, items that fail the
+    authenticity check and items already published that are not flagged with ``reprocess``
+    are added to ``publish_fail`` and skipped. The items already done in the ``journal``
+    are skipped before any lookup, and the items ``rejected`` by the pre-flight check are not published.
+
+    Args:
+        data - Items of the .json file, see `iter_manifest`
+        collection1 - Collection name given in the command line
+        authenticate - Flag to check the authenticity of the items
+        publish_fail - list with the names of the items not published
+        catalog - Catalog cache used to resolve the collections
+        preload_items - Skip the items already published using `CatalogCache.existing_items`
+        journal - Journal of the manifest, see `Journal.pending`
+        rejected - dict item name -> problems found by the pre-flight check, see `preflight.check_items`
+        incremental - Load the stored item of the items flagged with ``reprocess``, see `stored_item`
+    Yields:
+        dict with the item name, collection, dates, assets, the optional keys
+        ``reprocess``, ``cloud_cover`` and ``tile_id`` and the ``stored`` item (incremental reprocess)
+    """
+    total = len(data) if hasattr(data, '__len__') else None
+
+    count = 1
+    for i in data:
+
+        if journal is not None and not journal.pending(i['name']):
+            debug(f"Item {i['name']} already done in the journal {progress(count, total)}")
+            count+=1
+            continue
+
+        collection_name = i.get('collection', collection1)
+
+        if rejected and i['name'] in rejected:
+            error(f"Item {i['name']} rejected by the pre-flight check: {'; '.join(rejected[i['name']])} {progress(count, total)}")
+            count+=1
+            publish_fail.append(i['name'])
+            if journal is not None:
+                journal.defer(i['name'], 'failed', collection_name)
+            continue
+
+        try:
+            collection = catalog.collection(collection_name)
+        except:
+            error(f'Error checking the collection {collection_name}. This collection is not valid or does not exist.')
+            error(f"Error preparing to create item {i['name']} {progress(count, total)}")
+            count+=1
+            publish_fail.append(i['name'])
+            if journal is not None:
+                journal.defer(i['name'], 'failed', collection_name)
+            continue
+
+        if authenticate:
+            #Verifica a autenticidade do arquivo passado
+            if not authenticity(i['name'], collection_name):
+                error('The collection parameter does not match what is indicated in the file.')
+                error(f"Error preparing to create item {i['name']} {progress(count, total)}")
+                count+=1
+                publish_fail.append(i['name'])
+                if journal is not None:
+                    journal.defer(i['name'], 'failed', collection_name)
+                continue
+
+        reprocess = False
+        cloud_cover = None
+        tile_id = None
+
+        for key in i.keys():
+            if key=='reprocess':
+                reprocess = i[key]
+                continue
+
+            if key=='cloud_cover':
+                cloud_cover = i[key]
+                continue
+
+            if key=='tile_id':
+                tile_id = i[key]
+                continue
+
+        if preload_items and not reprocess and i['name'] in catalog.existing_items(collection):
+            warning(f"Image metadata is already in the database. Item: {i['name']} {progress(count, total)}")
+            count+=1
+            publish_fail.append(i['name'])
+            if journal is not None:
+                journal.defer(i['name'], 'skipped', collection_name)
+            continue
+
+        stored = None
+        if incremental and reprocess:
+            stored = stored_item(collection, i['name'])
+
+        info(f"Preparing to create item {i['name']} {progress(count, total)}")
+
+        yield dict(name=i['name'],
+                   collection=collection,
+                   reprocess=reprocess,
+                   cloud_cover=cloud_cover,
+                   tile_id=tile_id,
+                   start_date=i['start_date'],
+                   end_date=i['end_date'],
+                   assets=i['assets'],
+                   stored=stored)
+        count+=1
+
+def published_names(collection: Collection, names: list) -> set:
+    """Select the names already published in a collection, with a single query."""
+    query = (
+        db.session.query(Item.name)
+        .filter(Item.collection_id == collection.id, Item.name.in_(names))
+    )
+    return {name for name, in query}
+
+def skip_published(entries: Iterable[dict], chunk_size: int, publish_fail: list, journal: Optional[Journal] = None):
+    """Skip the entries already published that are not flagged with ``reprocess``.
+
+    In the batch mode the items are not looked up one by one before their metadata is
+    computed (see `BulkWriter`), so the entries are checked in chunks of ``chunk_size``
+    with one query per collection, see `published_names`.
+
+    Args:
+        entries - Entries of the manifest, see `manifest_entries`
+        chunk_size - Number of entries checked at a time
+        publish_fail - list with the names of the items not published
+        journal - Journal of the manifest, where the skipped items are recorded
+    Yields:
+        the entries to be published, in the manifest order
+    """
+    def _check(chunk: list):
+        names = dict()
+        for entry in chunk:
+            if not entry['reprocess']:
+                names.setdefault(entry['collection'].id, (entry['collection'], []))[1].append(entry['name'])
+
+        published = set()
+        for collection, collection_names in names.values():
+            published.update((collection.id, name) for name in published_names(collection, collection_names))
+
+        for entry in chunk:
+            if (entry['collection'].id, entry['name']) in published:
+                warning(f"Image metadata is already in the database. Item: {entry['name']}.")
+                publish_fail.append(entry['name'])
+                if journal is not None:
+                    journal.defer(entry['name'], 'skipped', entry['collection'].identifier)
+                continue
+            yield entry
+
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            yield from _check(chunk)
+            chunk = []
+
+    yield from _check(chunk)
+
+def move_processed(filename: str):
+    """Move a processed file to the processed directory."""
+    if not os.path.isdir(dir_file_processed):
+        try:
+            os.mkdir(dir_file_processed)
+        except:
+            error('Error when trying to create the "./processed" directory!')
+            return
+
+    fmt = '%Y%m%dT%H%M%S'
+    _now_str = datetime.now().strftime(fmt) #utcnow()
+    new_filename = (Path(filename).stem) + "_" + _now_str +"_processed.json"
+    new_file = os.path.join(dir_file_processed, new_filename)
+    try:
+        shutil.move(filename, new_file)
+    except:
+        error('Error moving JSON file.')
+
+def move_failed(filename: str):
+    """Move a file whose processing raised an unexpected error to the failed directory."""
+    fmt = '%Y%m%dT%H%M%S'
+    new_filename = Path(filename).stem + "_" + datetime.now().strftime(fmt) + Path(filename).suffix
+    try:
+        os.makedirs(dir_file_failed, exist_ok=True)
+        shutil.move(filename, os.path.join(dir_file_failed, new_filename))
+    except:
+        error(f'Error moving the file {filename} to {dir_file_failed}! {traceback.format_exc()}')
+
+def publish_file(collection1:str, filename:str, authenticate:bool, asset_workers:int = 1, workers:int = 1,
+                 batch_size:int = 0, preload_items:bool = False, catalog: Optional[CatalogCache] = None,
+                 stop_event: Optional[threading.Event] = None, journal_dir: Optional[str] = None,
+                 retry_failed: bool = False, preflight: bool = False, incremental: bool = False):
     # Verificar se existe um json
     info('Starting to publish the metadata in the database...')
-    logList.append('Starting to publish the metadata in the database...')
 
     publish_fail = []
+    lock = None
+    data = None
+    journal = None
+    completed = False
+
+    start_run()
+
+    if catalog is None:
+        catalog = CatalogCache()
 
     try:
         try:
-            collection = collection_by_identifier(collection1)
+            collection = catalog.collection(collection1)
         except:
             error('Error checking this collection. This collection is not valid or does not exist.')
-            logList.append('Error checking this collection. This collection is not valid or does not exist.')
             return
 
         info(f"Collection {collection.identifier} (id={collection.id}) found.")
-        logList.append(f"Collection {collection.identifier} (id={collection.id}) found.")
 
         lockfile = os.path.join("/tmp", os.path.basename(filename)) + ".lock"
         info(f"Creating lock file in {lockfile}")
         lock = FileLock(lockfile)
         lock.acquire()
 
-        with open(filename, 'r') as f:
-            data = json.load(f)
-            info(f"File {str(filename)} loaded, {len(data)} items to check.")
-            logList.append(f"File {str(filename)} loaded, {len(data)} items to check.")
-            count = 1        
-            for i in data:
-
-                if authenticate:
-                    #Verifica a autenticidade do arquivo passado
-                    if not authenticity(i['name'], collection1, count/len(data)):
-                        error('The collection parameter does not match what is indicated in the file.')
-                        logList.append('The collection parameter does not match what is indicated in the file.')
-                        error(f"Error preparing to create item {i['name']} [{count}/{len(data)}]")
-                        logList.append(f"Error preparing to create item {i['name']} [{count}/{len(data)}]")
-                        count+=1
-                        publish_fail.append(i['name'])
-                        continue
-
-                reprocess = False
-                cloud_cover = None
-                tile_id = None
-
-                for key in i.keys():
-                    if key=='reprocess':
-                        reprocess = i[key]
-                        continue
-
-                    if key=='cloud_cover':
-                        cloud_cover = i[key]
-                        continue
+        journal = Journal(journal_path(journal_dir, filename) if journal_dir else None, retry_failed)
+        if journal.status:
+            info(f"Resuming from the journal {journal.path}: {len(journal.status)} items recorded, "
+                 f"{len(journal.failed())} failed{' (retried)' if retry_failed else ''}.")
+
+        rejected = None
+        if preflight:
+            rejected = check_manifest(iter_manifest(filename), filename, logpath, preflight_workers)
+
+        if preload_items:
+            catalog.existing_items(collection)
+
+        data = iter_manifest(filename)
+        if stop_event is not None:
+            # Stop between items when a shutdown is requested
+            data = Interruptible(data, stop_event)
+        info(f"Reading the items of the file {str(filename)}...")
+        entries = manifest_entries(data, collection1, authenticate, publish_fail, catalog, preload_items, journal,
+                                   rejected, incremental)
+        writer = BulkWriter(catalog, batch_size, journal) if batch_size > 0 else None
+        if writer is not None and not preload_items:
+            entries = skip_published(entries, batch_size, publish_fail, journal)
 
-                    if key=='tile_id':
-                        tile_id = i[key]
-                        continue
-
-                info(f"Preparing to create item {i['name']} [{count}/{len(data)}]")
-                logList.append(f"Preparing to create item {i['name']} [{count}/{len(data)}]")
-
-                if not create_item(collection,
-                                   reprocess,
-                                   cloud_cover,
-                                   tile_id,
-                                   i['name'],
-                                   i['start_date'],
-                                   i['end_date'],
-                                   i['assets']):
-                    publish_fail.append(i['name'])
-                count+=1
-        f.close()
-    except IOError:
+        try:
+            if workers > 1:
+                publish_items_parallel(entries, workers, catalog, publish_fail, asset_workers, writer, journal)
+            elif writer is not None:
+                for entry in entries:
+                    info(f"Item: {entry['name']}...")
+                    timer = ItemTimer(entry['collection'].identifier, entry['name'])
+                    stored_assets = entry['stored']['assets'] if entry['stored'] is not None else None
+                    with timer.running():
+                        metadata = prepare_item(entry['collection'].identifier, entry['name'],
+                                                entry['assets'], asset_workers, stored_assets, entry['tile_id'])
+                    writer.add(entry, metadata, timer)
+            else:
+                for entry in entries:
+                    timer = ItemTimer(entry['collection'].identifier, entry['name'])
+                    with timer.running():
+                        saved = create_item(entry['collection'],
+                                            entry['reprocess'],
+                                            entry['cloud_cover'],
+                                            entry['tile_id'],
+                                            entry['name'],
+                                            entry['start_date'],
+                                            entry['end_date'],
+                                            entry['assets'],
+                                            asset_workers,
+                                            catalog,
+                                            entry['stored'])
+                    if not saved:
+                        if timer.status == 'ok':
+                            timer.status = 'failed'
+                        publish_fail.append(entry['name'])
+                    finish_item(timer, journal)
+        finally:
+            if writer is not None:
+                writer.flush()
+                publish_fail.extend(writer.publish_fail)
+
+        completed = True
+    except (IOError, ManifestError):
         error(u'Error reading the file! {}'.format(traceback.format_exc()))
-        logList.append(u'Error reading the file! {}'.format(traceback.format_exc()))
     finally:
-        lock.release()
+        if lock is not None:
+            lock.release()
+
+            # The file is moved only when every item is done; otherwise the journal resumes it.
+            # Without a journal file the failed items cannot be retried, so the file is moved anyway.
+            if isinstance(data, Interruptible) and data.interrupted:
+                warning(f'Stopped (shutdown requested or claim lost), the file {filename} was kept to be processed again.')
+            elif not completed:
+                warning(f'The file {filename} was not read to the end, it was kept to be processed again.')
+            elif journal.path and journal.failed():
+                warning(f'{len(journal.failed())} items of the file {filename} failed, it was kept to be '
+                        f'processed again with --retry-failed.')
+            else:
+                move_processed(filename)
+                journal.remove()
 
-        #Move the file for processed path
-        if not os.path.isdir(dir_file_processed):
+            if journal is not None:
+                journal.close()
+                if journal.resumed:
+                    info(f'{journal.resumed} items already done in the journal were skipped.')
+
+            #Cleaning unnecessary files if they exist.
             try:
-                os.mkdir(dir_file_processed)
+                if os.path.exists(lockfile):
+                    os.remove(lockfile)
             except:
-                error('Error when trying to create the "./processed" directory!')
-                logList.append('Error when trying to create the "./processed" directory!')
-                info('End of the process!')
-                logList.append('End of the process!')
-                write_log()
-                return
-                        
-        fmt = '%Y%m%dT%H%M%S'
-        _now_str = datetime.now().strftime(fmt) #utcnow()
-        new_filename = (Path(filename).stem) + "_" + _now_str +"_processed.json"
-        new_file = os.path.join(dir_file_processed, new_filename)
-        try:
-            shutil.move(filename, new_file)
-        except:
-            error('Error moving JSON file.')
-            logList.append('Error moving JSON file.')
+                error('Error when trying to delete the .lock file!')
 
-        #Cleaning unnecessary files if they exist.
-        try:
-            if os.path.exists(lockfile):
-                os.remove(lockfile)
-        except:
-            error('Error when trying to delete the .lock file!')
-            logList.append('Error when trying to delete the .lock file!')
+    # A single update of the extent of each collection with the items saved from the file
+    catalog.update_extents()
 
     if publish_fail:
         for namefail in publish_fail:
             info(f'Item {namefail} has not been published!')
-            logList.append(f'Item {namefail} has not been published!')
     else:
         info('Success: All items have been published!')
-        logList.append('Success: All items have been published!')
+
+    for line in summary():
+        info(line)
+
+    for profile in dump_profiles():
+        info(f'Profile of a slow item saved in {profile}')
+
+    try:
+        write_prometheus()
+    except OSError:
+        error(f'Error writing the Prometheus metrics! {traceback.format_exc()}')
 
     info('End of the process!')
-    logList.append('End of the process!')
 
-    #log
-    write_log()
+def process_file(collection1:str, filename:str, authenticate:bool, asset_workers:int = 1, workers:int = 1,
+                 batch_size:int = 0, preload_items:bool = False, catalog: Optional[CatalogCache] = None,
+                 stop_event: Optional[threading.Event] = None, journal_dir: Optional[str] = None,
+                 retry_failed: bool = False, preflight: bool = False, incremental: bool = False):
+    """Publish the items of a manifest, see `publish_file`.
+
+    The log records are written as they are emitted to a log file of the manifest,
+    rotated at ``log_max_bytes``.
+    """
+    with file_log(logpath, filename, log_max_bytes, log_backup_count) as sink:
+        publish_file(collection1, filename, authenticate, asset_workers=asset_workers, workers=workers,
+                     batch_size=batch_size, preload_items=preload_items, catalog=catalog, stop_event=stop_event,
+                     journal_dir=journal_dir, retry_failed=retry_failed, preflight=preflight,
+                     incremental=incremental)
+
+        if sink is not None:
+            info(f'Log records: {sink.summary()}. Log file: {sink.path}')
+
+def publish_manifest(collection1: str, filename: str, authenticate: bool, coordinator: Optional[Coordinator] = None,
+                     stop_event: Optional[threading.Event] = None, **options):
+    """Process a manifest, claiming it first when the publishers are coordinated.
+
+    The manifest is skipped when another publisher holds its claim, and it is left
+    (and resumed later from its journal) when the claim is lost while processing it.
+    """
+    if coordinator is None:
+        process_file(collection1, filename, authenticate, stop_event=stop_event, **options)
+        return
+
+    with coordinator.claim(filename) as lease:
+        if lease is None:
+            return
+        # The previous owner may have moved it before releasing the claim
+        if not os.path.exists(filename):
+            return
+        process_file(collection1, filename, authenticate, stop_event=AnyEvent(stop_event, lease.lost), **options)
+
+def preflight_file(filename: str):
+    """Check the assets of a manifest without publishing it (dry-run).
+
+    The manifest is not moved and the database is not accessed.
+    """
+    with file_log(logpath, filename, log_max_bytes, log_backup_count):
+        try:
+            check_manifest(iter_manifest(filename), filename, logpath, preflight_workers)
+        except (IOError, ManifestError):
+            error(u'Error reading the file! {}'.format(traceback.format_exc()))
 
 cli.add_command(collectionpublisher)
 
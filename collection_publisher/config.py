@@ -4,9 +4,81 @@ import os
 SQLALCHEMY_DATABASE_URI = os.environ.get("SQLALCHEMY_DATABASE_URI")
 prefixo = os.environ.get("COLLECTION_PUBLISHER_PREFIX")
 dir_file_processed = os.environ.get("COLLECTION_PUBLISHER_CONTAINER_FILE_PROCESSED")
+# Diretório para onde o modo --watch move os arquivos cujo processamento gerou um erro inesperado
+dir_file_failed = os.environ.get("COLLECTION_PUBLISHER_CONTAINER_FILE_FAILED", "./failed")
 sat_sensor_incluse = os.environ.get("COLLECTION_PUBLISHER_LIST").split(',')
 logpath = os.environ.get("COLLECTION_PUBLISHER_CONTAINER_LOG_DIR")
-prefixo_data = os.environ.get("COLLECTION_PUBLISHER_PREFIX_DATA")'''
+prefixo_data = os.environ.get("COLLECTION_PUBLISHER_PREFIX_DATA")
+
+# Número de threads usadas para preparar os assets de um item (1 = serial)
+asset_workers = int(os.environ.get("COLLECTION_PUBLISHER_ASSET_WORKERS", 1))
+
+# Número de processos usados para calcular os metadados dos itens (1 = serial)
+workers = int(os.environ.get("COLLECTION_PUBLISHER_WORKERS", 1))
+
+# Número de itens gravados por transação no modo em lote (0 = um item por vez)
+batch_size = int(os.environ.get("COLLECTION_PUBLISHER_BATCH_SIZE", 0))
+
+# Carrega os nomes dos itens já publicados, uma vez por coleção e execução (desativado por padrão:
+# a memória cresce com o tamanho da coleção)
+preload_items = os.environ.get("COLLECTION_PUBLISHER_PRELOAD_ITEMS", "0") == "1"
+
+# Cache dos checksums (arquivo SQLite) e número máximo de entradas
+checksum_cache = os.environ.get("COLLECTION_PUBLISHER_CHECKSUM_CACHE")
+checksum_cache_size = int(os.environ.get("COLLECTION_PUBLISHER_CHECKSUM_CACHE_SIZE", 1000000))
+
+# Tamanho (bytes) de cada leitura dos arquivos no cálculo do checksum
+checksum_read_size = int(os.environ.get("COLLECTION_PUBLISHER_CHECKSUM_READ_SIZE", 4 * 1024 * 1024))
+
+# Footprint: 'fast' (máscara reduzida) ou 'reference' (implementação original) e tolerância em pixels
+# (no modo 'fast' o footprint só é ampliado, nunca reduzido)
+footprint_mode = os.environ.get("COLLECTION_PUBLISHER_FOOTPRINT_MODE", "fast")
+footprint_tolerance = int(os.environ.get("COLLECTION_PUBLISHER_FOOTPRINT_TOLERANCE", 8))
+
+# Escalonamento dos arquivos no modo --directory: arquivos processados ao mesmo tempo, critérios da prioridade
+# (collection, age, size), prioridade por coleção (COLEÇÃO:N, maior primeiro) e limite de arquivos simultâneos por coleção
+# (COLLECTION_PUBLISHER_MANIFEST_WORKERS > 1 exige COLLECTION_PUBLISHER_WORKERS = 1)
+manifest_workers = int(os.environ.get("COLLECTION_PUBLISHER_MANIFEST_WORKERS", 1))
+schedule_order = [name for name in os.environ.get("COLLECTION_PUBLISHER_SCHEDULE_ORDER", "collection,age,size").split(',') if name]
+collection_priorities = {name: int(value) for name, value in (entry.rsplit(':', 1) for entry in
+                         os.environ.get("COLLECTION_PUBLISHER_COLLECTION_PRIORITIES", "").split(',') if entry)}
+collection_limits = {name: int(value) for name, value in (entry.rsplit(':', 1) for entry in
+                     os.environ.get("COLLECTION_PUBLISHER_COLLECTION_LIMITS", "").split(',') if entry)}
+
+# Intervalo (segundos) entre as varreduras do diretório no modo --watch
+poll_interval = float(os.environ.get("COLLECTION_PUBLISHER_POLL_INTERVAL", 5))
+
+# Coordenação de vários publicadores pelo banco de dados (tabela de claims) e duração do claim (segundos)
+coordinate = os.environ.get("COLLECTION_PUBLISHER_COORDINATE", "0") == "1"
+lease_seconds = int(os.environ.get("COLLECTION_PUBLISHER_LEASE_SECONDS", 300))
+
+# Verificação prévia dos arquivos e das chaves dos assets e número de diretórios listados em paralelo
+preflight = os.environ.get("COLLECTION_PUBLISHER_PREFLIGHT", "0") == "1"
+preflight_workers = int(os.environ.get("COLLECTION_PUBLISHER_PREFLIGHT_WORKERS", 16))
+
+# Bandas de referência de um item (srid e geometrias), em ordem de preferência
+reference_bands = [name for name in os.environ.get("COLLECTION_PUBLISHER_REFERENCE_BANDS", "red,B04,BAND15,NDVI,visual").split(',') if name]
+
+# Coleções de cubos de dados cujos itens cobrem o tile inteiro: o footprint e o bbox são reutilizados por tile
+grid_collections = [name for name in os.environ.get("COLLECTION_PUBLISHER_GRID_COLLECTIONS", "").split(',') if name]
+
+# Reprocessamento incremental: recalcula e grava apenas os assets e as colunas alterados
+incremental = os.environ.get("COLLECTION_PUBLISHER_INCREMENTAL", "0") == "1"
+
+# Diretório dos journals usados para retomar os arquivos interrompidos (vazio = desativado)
+journal_dir = os.environ.get("COLLECTION_PUBLISHER_JOURNAL_DIR", "./journal")
+
+# Tamanho máximo (bytes) de um arquivo de log antes da rotação e número de arquivos rotacionados mantidos
+log_max_bytes = int(os.environ.get("COLLECTION_PUBLISHER_LOG_MAX_BYTES", 10 * 1024 * 1024))
+log_backup_count = int(os.environ.get("COLLECTION_PUBLISHER_LOG_BACKUP_COUNT", 5))
+
+# Métricas: tempos por item e por etapa (JSON lines) e arquivo texto do Prometheus
+metrics_file = os.environ.get("COLLECTION_PUBLISHER_METRICS_FILE")
+metrics_prom = os.environ.get("COLLECTION_PUBLISHER_METRICS_PROM")
+
+# Perfil (cProfile) dos N itens mais lentos de cada arquivo (0 = desativado) e diretório dos perfis
+profile_items = int(os.environ.get("COLLECTION_PUBLISHER_PROFILE_ITEMS", 0))
+profile_dir = os.environ.get("COLLECTION_PUBLISHER_PROFILE_DIR", "./profiles")
 
 COG_MIME_TYPE = 'image/tiff; application=geotiff; profile=cloud-optimized'
 
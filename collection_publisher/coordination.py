@@ -0,0 +1,160 @@
+"""Coordination of several publishers sharing an input directory.
+
+The publishers claim the manifests in a table of the catalog database before processing
+them, so a manifest is processed by a single publisher even when the input volume is shared
+by containers on different hosts. A claim is a lease: its owner renews it in a background
+thread while the manifest is processed and deletes it at the end. The claim of a publisher
+that died expires after ``lease_seconds`` and the manifest is claimed again by another
+publisher, which resumes it from the journal of the manifest (the journal directory must
+be shared as well).
+"""
+
+import os
+import socket
+import threading
+import uuid
+
+from contextlib import contextmanager
+from datetime import timedelta
+from logging import info, warning
+from typing import Iterator, Optional
+
+from sqlalchemy import Column, DateTime, MetaData, Table, Text, delete, func, update
+from sqlalchemy.dialects.postgresql import insert
+
+metadata = MetaData()
+
+claims = Table(
+    'collection_publisher_claims', metadata,
+    Column('manifest', Text, primary_key=True),
+    Column('owner', Text, nullable=False),
+    Column('claimed', DateTime(timezone=True), nullable=False),
+    Column('expires', DateTime(timezone=True), nullable=False),
+)
+
+
+class AnyEvent:
+    """Event-like view that is set when any of ``events`` is set."""
+
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self) -> bool:
+        return any(event.is_set() for event in self.events)
+
+
+class Lease:
+    """Claim of a manifest, renewed by a background thread.
+
+    ``lost`` is set when the claim could not be renewed, e.g. it expired and was
+    taken by another publisher; the manifest must then be left as soon as possible.
+    """
+
+    def __init__(self, coordinator: 'Coordinator', key: str):
+        self.coordinator = coordinator
+        self.key = key
+        self.lost = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name=f'lease-{key}', daemon=True)
+
+    def _heartbeat(self):
+        interval = max(1.0, self.coordinator.lease_seconds / 3)
+        while not self._done.wait(interval):
+            try:
+                renewed = self.coordinator.renew(self.key)
+            except Exception as e:
+                # A transient database error: try again before the lease expires
+                warning(f'Error renewing the claim of {self.key}: {e}')
+                continue
+            if not renewed:
+                warning(f'The claim of {self.key} was lost, the file will be left.')
+                self.lost.set()
+                return
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+
+
+class Coordinator:
+    """Claims of the manifests in the catalog database.
+
+    Args:
+        engine - SQLAlchemy engine of the catalog database (PostgreSQL)
+        lease_seconds - Duration of a claim; it is renewed every third of it
+        root - Input directory. The manifests are identified by their path relative to it,
+            so the hosts may mount the shared volume on different paths.
+    """
+
+    def __init__(self, engine, lease_seconds: int = 300, root: Optional[str] = None):
+        self.engine = engine
+        self.lease_seconds = lease_seconds
+        self.root = root
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+    def create_table(self):
+        """Create the claim table when it does not exist."""
+        metadata.create_all(self.engine, tables=[claims], checkfirst=True)
+
+    def key(self, filename: str) -> str:
+        if self.root:
+            return os.path.relpath(os.path.abspath(filename), os.path.abspath(self.root))
+        return os.path.abspath(filename)
+
+    def try_claim(self, key: str) -> bool:
+        """Claim a manifest; an expired claim of another publisher is taken over."""
+        lease = timedelta(seconds=self.lease_seconds)
+        statement = insert(claims).values(manifest=key, owner=self.owner,
+                                          claimed=func.now(), expires=func.now() + lease)
+        statement = statement.on_conflict_do_update(
+            index_elements=[claims.c.manifest],
+            set_=dict(owner=statement.excluded.owner, claimed=statement.excluded.claimed,
+                      expires=statement.excluded.expires),
+            where=(claims.c.expires < func.now()) | (claims.c.owner == self.owner),
+        ).returning(claims.c.owner)
+
+        with self.engine.begin() as connection:
+            return connection.execute(statement).first() is not None
+
+    def renew(self, key: str) -> bool:
+        """Extend a claim of this publisher; False when the claim is no longer ours."""
+        statement = (update(claims)
+                     .where(claims.c.manifest == key, claims.c.owner == self.owner)
+                     .values(expires=func.now() + timedelta(seconds=self.lease_seconds)))
+        with self.engine.begin() as connection:
+            return connection.execute(statement).rowcount == 1
+
+    def release(self, key: str):
+        """Delete a claim of this publisher."""
+        statement = delete(claims).where(claims.c.manifest == key, claims.c.owner == self.owner)
+        with self.engine.begin() as connection:
+            connection.execute(statement)
+
+    @contextmanager
+    def claim(self, filename: str) -> Iterator[Optional[Lease]]:
+        """Claim a manifest for the block.
+
+        Yields:
+            Lease of the manifest, or None when it is claimed by another publisher
+        """
+        key = self.key(filename)
+
+        if not self.try_claim(key):
+            info(f'The file {key} is being processed by another publisher, skipped.')
+            yield None
+            return
+
+        lease = Lease(self, key)
+        lease.start()
+        try:
+            yield lease
+        finally:
+            lease.stop()
+            if not lease.lost.is_set():
+                try:
+                    self.release(key)
+                except Exception as e:
+                    warning(f'Error releasing the claim of {key}, it will expire: {e}')
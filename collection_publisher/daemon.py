@@ -0,0 +1,172 @@
+"""Watch mode: keep the publisher running and process the manifests as they land.
+
+The input directory is watched with inotify when the optional package ``inotify_simple``
+is installed (Linux), otherwise it is polled. SIGTERM and SIGINT request a graceful
+shutdown: the items in progress are finished and no new manifest is started.
+"""
+
+import os
+import signal
+import threading
+
+from logging import info, warning
+from typing import Iterable, Iterator
+
+from .manifest import MANIFEST_EXTENSIONS
+
+#: Set when a shutdown was requested
+shutdown = threading.Event()
+
+
+def install_signal_handlers():
+    """Request a graceful shutdown on SIGTERM and SIGINT."""
+    def _handler(signum, frame):
+        if not shutdown.is_set():
+            warning(f'Signal {signal.Signals(signum).name} received, finishing the items in progress...')
+        shutdown.set()
+
+    signal.signal(signal.SIGTERM, _handler)
+    signal.signal(signal.SIGINT, _handler)
+
+
+class Interruptible:
+    """Iterate over ``items`` until ``event`` is set.
+
+    Args:
+        items - Iterable to be consumed
+        event - Event that stops the iteration
+    """
+
+    def __init__(self, items: Iterable, event: threading.Event):
+        self.items = items
+        self.event = event
+        self.interrupted = False
+
+    def __iter__(self):
+        for item in self.items:
+            if self.event.is_set():
+                self.interrupted = True
+                return
+            yield item
+
+
+def scan_manifests(directory: str, exclude: set) -> dict:
+    """List the manifests of a directory tree.
+
+    Args:
+        directory - Directory tree to be listed
+        exclude - Absolute paths of the directories and files that are not listed
+    Returns:
+        dict path -> (size, mtime_ns)
+    """
+    manifests = dict()
+    pending = [directory]
+
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except OSError as e:
+            warning(f'Error listing the directory {e.filename}: {e.strerror}')
+            continue
+
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.abspath(entry.path) not in exclude:
+                        pending.append(entry.path)
+                elif (os.path.splitext(entry.name)[1] in MANIFEST_EXTENSIONS
+                      and os.path.abspath(entry.path) not in exclude):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    manifests[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+    return manifests
+
+
+def _watch_polling(directory: str, poll_interval: float, exclude: set) -> Iterator[str]:
+    """Poll the directory tree; a manifest is ready when its size and mtime are stable between two scans."""
+    seen = set()
+    previous = dict()
+
+    while not shutdown.is_set():
+        current = scan_manifests(directory, exclude)
+
+        for path in sorted(current):
+            if path not in seen and previous.get(path) == current[path]:
+                seen.add(path)
+                yield path
+                if shutdown.is_set():
+                    return
+
+        # A manifest moved away may come back with the same name
+        seen &= set(current)
+        previous = current
+
+        shutdown.wait(poll_interval)
+
+
+def _watch_inotify(directory: str, poll_interval: float, exclude: set) -> Iterator[str]:
+    """Watch the directory tree with inotify; a manifest is ready when it is closed for writing or moved in."""
+    from inotify_simple import INotify, flags
+
+    watch_flags = flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE
+
+    with INotify() as inotify:
+        watches = dict()
+
+        def _add(path: str) -> list:
+            for root, dirs, _ in os.walk(path):
+                dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) not in exclude]
+                watches[inotify.add_watch(root, watch_flags)] = root
+            # Manifests written before the watch was added
+            return sorted(scan_manifests(path, exclude))
+
+        for path in _add(directory):
+            yield path
+
+        while not shutdown.is_set():
+            for event in inotify.read(timeout=int(poll_interval * 1000)):
+                root = watches.get(event.wd)
+                if root is None or not event.name:
+                    continue
+
+                path = os.path.join(root, event.name)
+
+                if event.mask & flags.ISDIR:
+                    if os.path.abspath(path) not in exclude:
+                        for manifest in _add(path):
+                            yield manifest
+                elif event.mask & (flags.CLOSE_WRITE | flags.MOVED_TO):
+                    if (os.path.splitext(event.name)[1] in MANIFEST_EXTENSIONS
+                            and os.path.abspath(path) not in exclude):
+                        yield path
+
+                if shutdown.is_set():
+                    return
+
+
+def watch_manifests(directory: str, poll_interval: float = 5.0, exclude: Iterable[str] = ()) -> Iterator[str]:
+    """Yield the manifests of a directory tree: the existing ones first, then the new ones as they land.
+
+    The iteration ends when a shutdown is requested.
+
+    Args:
+        directory - Directory to be watched
+        poll_interval - Seconds between two scans (polling) or two shutdown checks (inotify)
+        exclude - Directories not watched and files not yielded, e.g. the processed directory and the journals
+    """
+    exclude = {os.path.abspath(path) for path in exclude if path}
+
+    try:
+        import inotify_simple
+    except ImportError:
+        inotify_simple = None
+
+    if inotify_simple is not None:
+        info(f'Watching {directory} with inotify...')
+        return _watch_inotify(directory, poll_interval, exclude)
+
+    info(f'Watching {directory}, polling every {poll_interval}s...')
+    return _watch_polling(directory, poll_interval, exclude)
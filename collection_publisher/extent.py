@@ -0,0 +1,73 @@
+"""Spatial and temporal extent of the collections.
+
+While a manifest is published, the dates and the bbox of the items saved in each collection
+are folded into a running `CollectionExtent` (min/max of the dates and of the bbox bounds).
+At the end of the manifest a single UPDATE per collection widens the stored extent with it,
+so the extent of the collections is kept up to date without scanning the item table.
+
+The extent only grows: items removed or reprocessed with a smaller extent are not taken out.
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, update
+
+
+class CollectionExtent:
+    """Running extent of the items saved in a collection."""
+
+    def __init__(self):
+        self.items = 0
+        self.start_date: Optional[datetime] = None
+        self.end_date: Optional[datetime] = None
+        self.bounds: Optional[list] = None
+
+    def add(self, start_date: Optional[datetime], end_date: Optional[datetime], bounds: Optional[tuple] = None):
+        """Fold an item in the extent.
+
+        Args:
+            start_date - Start date of the item
+            end_date - End date of the item
+            bounds - bbox (xmin, ymin, xmax, ymax) of the item in EPSG:4326, when computed
+        """
+        self.items += 1
+
+        if start_date is not None and (self.start_date is None or start_date < self.start_date):
+            self.start_date = start_date
+        if end_date is not None and (self.end_date is None or end_date > self.end_date):
+            self.end_date = end_date
+
+        if bounds is not None:
+            if self.bounds is None:
+                self.bounds = list(bounds)
+            else:
+                self.bounds = [min(self.bounds[0], bounds[0]), min(self.bounds[1], bounds[1]),
+                               max(self.bounds[2], bounds[2]), max(self.bounds[3], bounds[3])]
+
+    def statement(self, table, collection_id: int):
+        """UPDATE widening the stored extent of a collection, or None when there is nothing to update.
+
+        ``LEAST`` and ``GREATEST`` ignore NULLs in PostgreSQL, so an empty stored extent is
+        replaced by the running one.
+        """
+        values = dict()
+
+        if self.start_date is not None:
+            values['start_date'] = func.least(table.c.start_date, self.start_date)
+        if self.end_date is not None:
+            values['end_date'] = func.greatest(table.c.end_date, self.end_date)
+
+        if self.bounds is not None:
+            xmin, ymin, xmax, ymax = self.bounds
+            current = table.c.spatial_extent
+            values['spatial_extent'] = func.ST_MakeEnvelope(
+                func.least(func.ST_XMin(current), xmin), func.least(func.ST_YMin(current), ymin),
+                func.greatest(func.ST_XMax(current), xmax), func.greatest(func.ST_YMax(current), ymax),
+                4326
+            )
+
+        if not values:
+            return None
+
+        return update(table).where(table.c.id == collection_id).values(**values)
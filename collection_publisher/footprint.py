@@ -0,0 +1,175 @@
+"""Footprint of the raster assets.
+
+Two implementations are available:
+
+- ``fast``: reads the dataset mask at a decimated resolution (using the overviews when
+  present), finds the boundary of the valid pixels with NumPy and reprojects only these
+  points with a cached transformer.
+- ``reference``: the original implementation, which polygonizes the full resolution mask,
+  reprojects every shape and unions them with GeoPandas.
+"""
+
+import math
+
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from .raster import probe_raster
+
+if TYPE_CHECKING:
+    import numpy
+    import pyproj
+
+FOOTPRINT_MODES = ('fast', 'reference')
+
+_mode = 'fast'
+_tolerance = 8
+
+
+def configure_footprint(mode: str = 'fast', tolerance: int = 8):
+    """Set the footprint implementation used by `get_footprint`.
+
+    Args:
+        mode - 'fast' or 'reference'
+        tolerance - Decimation factor of the mask read in the fast mode. The footprint may be
+            up to this many pixels of the full resolution raster larger on each side, never smaller.
+    """
+    global _mode, _tolerance
+
+    if mode not in FOOTPRINT_MODES:
+        raise ValueError(f'Invalid footprint mode {mode!r}, expected one of {FOOTPRINT_MODES}.')
+
+    _mode = mode
+    _tolerance = max(1, int(tolerance))
+
+
+@lru_cache(maxsize=32)
+def transformer(src_crs: str, dst_crs: str) -> 'pyproj.Transformer':
+    """Get a (cached) transformer between two CRS given as WKT or authority strings."""
+    from pyproj import CRS, Transformer
+
+    return Transformer.from_crs(CRS.from_user_input(src_crs), CRS.from_user_input(dst_crs), always_xy=True)
+
+
+def mask_boundary(mask: 'numpy.ndarray', margin: int = 0) -> tuple:
+    """Get the outer boundary points of the valid pixels of a mask.
+
+    For each row (and column) with valid pixels, the corners of its first and last valid
+    pixels are returned, which includes every extreme point of the valid region.
+
+    Args:
+        mask - Mask of the valid pixels
+        margin - Number of pixels the points are moved outward, within the mask
+    Returns:
+        tuple (cols, rows) of the points in pixel coordinates, or None when there is no valid pixel
+    """
+    import numpy
+
+    valid = mask > 0
+
+    rows = numpy.flatnonzero(valid.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = numpy.flatnonzero(valid.any(axis=0))
+
+    # First and last valid column of each valid row, and the same for each valid column
+    row_first = valid[rows].argmax(axis=1)
+    row_last = valid.shape[1] - 1 - valid[rows, ::-1].argmax(axis=1)
+    col_first = valid[:, cols].argmax(axis=0)
+    col_last = valid.shape[0] - 1 - valid[::-1, cols].argmax(axis=0)
+
+    xs = numpy.concatenate([row_first - margin, row_first - margin, row_last + 1 + margin, row_last + 1 + margin,
+                            cols - margin, cols + 1 + margin, cols - margin, cols + 1 + margin])
+    ys = numpy.concatenate([rows - margin, rows + 1 + margin, rows - margin, rows + 1 + margin,
+                            col_first - margin, col_first - margin, col_last + 1 + margin, col_last + 1 + margin])
+
+    return numpy.clip(xs, 0, valid.shape[1]), numpy.clip(ys, 0, valid.shape[0])
+
+
+def get_footprint_fast(imagepath: str, epsg='EPSG:4326', tolerance: int = 8) -> tuple:
+    """Get image footprint from a decimated dataset mask.
+
+    Args:
+        imagepath (str): Image file
+        epsg (str): CRS of the result
+        tolerance (int): Decimation factor of the mask, in pixels
+    Returns:
+        tuple (bounds, geometry) - bounds (xmin, ymin, xmax, ymax) of the valid pixels
+        and its box geometry, in the ``epsg`` CRS
+
+    A valid edge may fall inside a decimated cell read as invalid, so the boundary is
+    grown by one decimated cell: the footprint contains every valid pixel and is at most
+    ``tolerance`` pixels larger on each side.
+    """
+    import numpy
+    import rasterio
+    import shapely.geometry
+
+    with probe_raster(imagepath) as probe:
+        height, width = probe.shape
+        out_shape = (max(1, math.ceil(height / tolerance)), max(1, math.ceil(width / tolerance)))
+
+        mask = probe.dataset_mask(out_shape=out_shape)
+        src_crs = probe.crs.to_wkt()
+        transform = probe.transform * rasterio.Affine.scale(width / out_shape[1], height / out_shape[0])
+
+    points = mask_boundary(mask, margin=1)
+    if points is None:
+        # No valid pixel: use the raster extent
+        points = (numpy.array([0, out_shape[1], 0, out_shape[1]]), numpy.array([0, 0, out_shape[0], out_shape[0]]))
+
+    xs, ys = transform * points
+    xs, ys = transformer(src_crs, epsg).transform(xs, ys)
+
+    bounds = tuple(round(float(value), 6) for value in (numpy.min(xs), numpy.min(ys), numpy.max(xs), numpy.max(ys)))
+
+    return bounds, shapely.geometry.box(*bounds)
+
+
+def get_footprint_reference(imagepath: str, epsg='EPSG:4326') -> tuple:
+    """Get image footprint
+
+    Reference implementation, kept to validate `get_footprint_fast`.
+
+    Args:
+        imagepath (str): Image file
+        epsg (str): Image's EPSG
+
+    See:
+        https://rasterio.readthedocs.io/en/latest/topics/masks.html
+    """
+    import geopandas as gpd
+    import pandas as pd
+    import rasterio.features
+    import rasterio.warp
+    import shapely.geometry
+
+    with rasterio.open(str(imagepath), driver = "GTiff") as dataset:
+        mask = dataset.dataset_mask()
+
+        geoms = []
+        res = {'val': []}
+        for geom, val in rasterio.features.shapes(mask, transform=dataset.transform):
+
+            geom = rasterio.warp.transform_geom(dataset.crs, epsg, geom, precision=6)
+
+            res['val'].append(val)
+
+            geoms.append(shapely.geometry.shape(geom))
+
+        df = pd.DataFrame(data = res)
+        gdf = gpd.GeoDataFrame(df, crs=epsg, geometry = geoms)
+
+    return gdf.unary_union.bounds, geoms[0]
+
+
+def get_footprint(imagepath: str, epsg='EPSG:4326') -> tuple:
+    """Get image footprint with the implementation set by `configure_footprint`.
+
+    Returns:
+        tuple (bounds, geometry) in the ``epsg`` CRS
+    """
+    if _mode == 'reference':
+        return get_footprint_reference(imagepath, epsg)
+
+    return get_footprint_fast(imagepath, epsg, _tolerance)
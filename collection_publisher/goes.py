@@ -0,0 +1,61 @@
+"""Metadata of the GOES NetCDF items.
+
+The GOES collections publish an item every 10 minutes per band, always on the same fixed
+grid of the satellite and product. The extent and the grid attributes are read with a
+single netCDF4 open (see `raster.NetCDFProbe`), and the SRID and the bbox geometry are
+computed once per grid and reused by the next items.
+"""
+
+import threading
+
+from logging import debug
+
+from .raster import probe_raster
+
+#: Attributes of ``geospatial_lat_lon_extent`` with the bbox (xmin, ymin, xmax, ymax)
+EXTENT_ATTRIBUTES = ('geospatial_westbound_longitude', 'geospatial_southbound_latitude',
+                     'geospatial_eastbound_longitude', 'geospatial_northbound_latitude')
+
+_grids = dict()
+_lock = threading.Lock()
+
+
+def grid_key(probe) -> tuple:
+    """Identify the grid of a GOES file: satellite, scene, variable, shape, projection and extent."""
+    return (
+        str(probe.attributes.get('platform_ID')),
+        str(probe.attributes.get('scene_id')),
+        probe.variable,
+        probe.shape,
+        tuple(sorted((name, str(value)) for name, value in probe.grid_mapping.items())),
+        # Through str, like the bbox parsed before: float32 attributes keep their short decimal value
+        tuple(float(str(probe.extent[name])) for name in EXTENT_ATTRIBUTES),
+    )
+
+
+def goes_metadata(path: str) -> tuple:
+    """Get the SRID and the bbox of a GOES NetCDF file.
+
+    Returns:
+        tuple (srid, bbox geometry); srid is None when the grid has no authority code
+    Raises:
+        KeyError when the file has no ``geospatial_lat_lon_extent``
+    """
+    with probe_raster(path) as probe:
+        key = grid_key(probe)
+
+        with _lock:
+            grid = _grids.get(key)
+
+        if grid is None:
+            import shapely.geometry
+
+            # The SRID needs GDAL: it is only read for the first file of each grid
+            srid = probe.epsg
+            bbox = shapely.geometry.box(*key[-1]).envelope
+
+            with _lock:
+                grid = _grids.setdefault(key, (srid, bbox))
+            debug(f"GOES grid {key[:4]} cached.")
+
+    return grid
@@ -0,0 +1,56 @@
+"""Geometries of the items of a fixed grid of tiles.
+
+The items of a data cube collection published on the same tile share the same grid, so
+their srid and extent are computed for the first item of each tile and reused for the
+next ones. The grid of each item is checked from the header of its reference band
+(shape, transform and CRS, see `raster.TiffHeaderProbe.grid_signature`): an item on a
+different grid is computed again and replaces the cached geometries of the tile.
+
+The footprint and the bbox come from the valid pixels of an item, so they are only
+reused for the collections of ``grid_collections``, whose items cover the whole tile.
+"""
+
+import threading
+
+from logging import debug
+from typing import Optional
+
+from .config import grid_collections
+from .raster import probe_raster
+
+_grids = dict()
+_lock = threading.Lock()
+
+
+def grid_signature(path: str) -> Optional[tuple]:
+    """Grid (shape, transform and CRS) of a raster, read from its header when possible."""
+    with probe_raster(path) as probe:
+        return probe.grid_signature
+
+
+def cached_geometry(collection_identifier: str, tile: str, signature: tuple) -> dict:
+    """Get the geometries cached for a tile.
+
+    Returns:
+        dict with the keys ``srid`` and ``geom`` and, for the collections of ``grid_collections``,
+        ``footprint`` and ``bbox``; empty when the tile is not cached or its grid changed
+    """
+    with _lock:
+        cached = _grids.get((collection_identifier, tile))
+
+    if cached is None or cached[0] != signature:
+        return dict()
+
+    return cached[1]
+
+
+def cache_geometry(collection_identifier: str, tile: str, signature: tuple,
+                   srid: Optional[int], geom, footprint: tuple, bbox):
+    """Cache the geometries of an item for the next items of its tile."""
+    values = dict(srid=srid, geom=geom)
+    if collection_identifier in grid_collections:
+        values.update(footprint=footprint, bbox=bbox)
+
+    with _lock:
+        _grids[(collection_identifier, tile)] = (signature, values)
+    debug(f"Geometries of the tile {tile} of {collection_identifier} cached.")
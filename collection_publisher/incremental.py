@@ -0,0 +1,101 @@
+"""Incremental reprocess of the items already published.
+
+With ``--incremental``, an item flagged with ``reprocess`` is compared with its stored
+version instead of being rebuilt. A stored asset is reused when its href and size did not
+change and its file was not modified after the asset was published (``updated``); only
+the other assets are created again (checksum and raster probe). The srid, extent and
+footprint are only computed again when the reference band changed, and the item is
+saved with an UPDATE of the columns that changed.
+"""
+
+import os
+
+from datetime import datetime, timezone
+from typing import Optional
+
+#: Format of the ``created`` and ``updated`` dates of the assets, see `cli.create_asset`
+ASSET_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+#: Keys of an asset that change every time it is created, even for the same file
+ASSET_DATE_KEYS = ('created', 'updated')
+
+#: Item columns compared with the stored values; the geometries are always written when computed
+COMPARED_COLUMNS = ('assets', 'cloud_cover', 'start_date', 'end_date', 'tile_id', 'srid')
+
+
+def asset_unchanged(stored: Optional[dict], href: str, stat: os.stat_result) -> bool:
+    """Check if a stored asset still describes a file.
+
+    The modification time is compared with the publication date of the asset, which has a
+    precision of seconds: a file modified in the same second is taken as changed.
+    """
+    if not stored or stored.get('href') != str(href) or stored.get('bdc:size') != stat.st_size:
+        return False
+
+    try:
+        published = datetime.strptime(stored.get('updated') or stored['created'], ASSET_DATE_FORMAT)
+    except (KeyError, TypeError, ValueError):
+        return False
+
+    return datetime.fromtimestamp(stat.st_mtime, timezone.utc) < published.replace(tzinfo=timezone.utc)
+
+
+def reusable_assets(jobs: list, stored_assets: dict) -> dict:
+    """Select the stored assets that can be reused.
+
+    Args:
+        jobs - list of (asset key, create_asset kwargs), see `cli.asset_jobs`
+        stored_assets - Assets of the stored item
+    Returns:
+        dict asset key -> stored asset, for the assets whose file did not change
+    """
+    reused = dict()
+
+    for key, kwargs in jobs:
+        try:
+            stat = os.stat(kwargs['absolute_path'])
+        except OSError:
+            # Created again, so the error is reported as for a new item
+            continue
+        if asset_unchanged(stored_assets.get(key), kwargs['href'], stat):
+            reused[key] = stored_assets[key]
+
+    return reused
+
+
+def same_asset(stored: Optional[dict], asset: dict) -> bool:
+    """Check if an asset created again is the stored one, apart from its dates (e.g. a touched file).
+
+    An asset that could not be created (None) is never the stored one.
+    """
+    if not stored or not asset:
+        return False
+    return ({key: value for key, value in stored.items() if key not in ASSET_DATE_KEYS} ==
+            {key: value for key, value in asset.items() if key not in ASSET_DATE_KEYS})
+
+
+def _naive_utc(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def changed_columns(stored: dict, columns: dict) -> dict:
+    """Select the item columns to be written by the incremental reprocess.
+
+    Args:
+        stored - Stored values of the item, see `cli.stored_item`
+        columns - Column values of the reprocessed item, see `cli.item_columns`
+    Returns:
+        dict with the columns that differ from the stored values and the geometries, when computed
+    """
+    changed = dict()
+
+    for column, value in columns.items():
+        if column in COMPARED_COLUMNS and _naive_utc(stored.get(column)) == _naive_utc(value):
+            continue
+        if column == 'is_available' and stored.get(column) == value:
+            continue
+        changed[column] = value
+
+    return changed
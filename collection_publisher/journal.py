@@ -0,0 +1,125 @@
+"""Journal of the items of a manifest.
+
+The outcome of each item (``ok``, ``skipped`` or ``failed``) is appended to the journal of
+its manifest once it is committed to the database. When the publisher is restarted on the
+same manifest, the items already in the journal are skipped before any checksum or query,
+so the run resumes after the last committed item. The failed items are only published
+again when asked to (``--retry-failed``).
+
+The journal is a JSON lines file, flushed and synced after each write. A truncated last
+line, left by a crash in the middle of a write, is ignored. The outcomes of the items that
+are not sent to the database (rejected or already published) are deferred and written with
+the next write, so they do not cost a sync each.
+"""
+
+import hashlib
+import json
+import os
+
+from datetime import datetime
+from logging import warning
+from pathlib import Path
+from typing import Iterable, Optional
+
+#: Number of deferred outcomes that forces a write, see `Journal.defer`
+DEFERRED_SIZE = 1000
+
+def journal_path(directory: str, filename: str) -> str:
+    """Path of the journal of a manifest: its name plus a hash of its absolute path."""
+    digest = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(directory, f'{Path(filename).stem}-{digest}.jsonl')
+
+
+class Journal:
+    """Append-only journal of the items of a manifest.
+
+    Args:
+        path - Journal file. When None, the outcomes are only kept in memory.
+        retry_failed - Flag to publish again the items that failed in a previous run
+    """
+
+    def __init__(self, path: Optional[str], retry_failed: bool = False):
+        self.path = path
+        self.retry_failed = retry_failed
+        self.status = dict()
+        self.resumed = 0
+        self._file = None
+        self._deferred = []
+
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path) as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    warning(f'Invalid line {number} of the journal {self.path} ignored.')
+                    continue
+                self.status[entry['item']] = entry['status']
+
+    def pending(self, item_name: str) -> bool:
+        """Check if an item must be published: it is not in the journal, or it failed and will be retried."""
+        status = self.status.get(item_name)
+        if status is None or (status == 'failed' and self.retry_failed):
+            return True
+
+        self.resumed += 1
+        return False
+
+    def add(self, item_name: str, status: str, collection: Optional[str] = None):
+        """Record the outcome of an item."""
+        self.extend([(item_name, status, collection)])
+
+    def defer(self, item_name: str, status: str, collection: Optional[str] = None):
+        """Record the outcome of an item not sent to the database, written with the next outcomes.
+
+        A crash before the write only loses outcomes that are cheap to find again.
+        """
+        self.status[item_name] = status
+        self._deferred.append((item_name, status, collection))
+        if len(self._deferred) >= DEFERRED_SIZE:
+            self.extend([])
+
+    def extend(self, outcomes: Iterable[tuple]):
+        """Record the outcomes (item name, status, collection) of committed items, with a single sync."""
+        lines = []
+        _now_str = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')
+        outcomes, self._deferred = self._deferred + list(outcomes), []
+        for item_name, status, collection in outcomes:
+            self.status[item_name] = status
+            lines.append(json.dumps(dict(time=_now_str, item=item_name, collection=collection, status=status)))
+
+        if not self.path or not lines:
+            return
+
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, 'a+')
+            # Terminate a line truncated by a crash, so it does not swallow the next entry
+            if self._file.tell() > 0:
+                self._file.seek(self._file.tell() - 1)
+                if self._file.read(1) != '\n':
+                    self._file.write('\n')
+
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def failed(self) -> list:
+        """Names of the items whose last outcome is ``failed``."""
+        return [name for name, status in self.status.items() if status == 'failed']
+
+    def close(self):
+        if self._deferred:
+            self.extend([])
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Delete the journal, once every item of the manifest is done."""
+        self.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,148 @@
+"""Log files of the processed manifests.
+
+While a manifest is processed, a `LogSink` attached to the root logger writes each record
+to the log file of that manifest as it is emitted. The file is rotated when it reaches
+``max_bytes`` and at most ``backup_count`` rotated files are kept, so a huge manifest
+cannot fill the disk. Only the number of records per level and the last errors are kept
+in memory.
+
+Worker processes do not write to the file: `capture_logs` collects their records, which
+are sent back and written by the parent process with `replay`.
+
+The sink of a manifest only takes the records emitted in its context (the thread of the
+manifest and the tasks run with `contextvars.copy_context`), so the manifests processed
+concurrently by the scheduler write separate files.
+"""
+
+import logging
+import os
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Iterator, Optional
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+_active: ContextVar[Optional['LogSink']] = ContextVar('log_sink', default=None)
+
+
+class LogSink(logging.Handler):
+    """Write the log records to a rotating file.
+
+    Args:
+        path - Log file
+        max_bytes - Size of the file that triggers a rotation (0 = never rotate)
+        backup_count - Number of rotated files kept
+        keep_errors - Number of error messages kept in memory, see `errors`
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 2 ** 20, backup_count: int = 5,
+                 keep_errors: int = 20, level=logging.INFO):
+        super().__init__(level)
+        self.path = path
+        self.pid = os.getpid()
+        self.counts = dict()
+        self.errors = deque(maxlen=keep_errors)
+
+        self.file = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        self.file.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+    def emit(self, record: logging.LogRecord):
+        # Forked workers inherit the handler, but only the parent process writes the file
+        if os.getpid() != self.pid or _active.get() is not self:
+            return
+
+        self.counts[record.levelname] = self.counts.get(record.levelname, 0) + 1
+        if record.levelno >= logging.ERROR:
+            self.errors.append(record.getMessage())
+
+        self.file.emit(record)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+    def summary(self) -> str:
+        """Number of records per level, e.g. ``INFO: 120, WARNING: 3, ERROR: 1``."""
+        return ', '.join(f'{level}: {count}' for level, count in sorted(self.counts.items()))
+
+
+@contextmanager
+def file_log(directory: str, filename: str, max_bytes: int = 10 * 2 ** 20,
+             backup_count: int = 5) -> Iterator[Optional[LogSink]]:
+    """Write the log records of the block to a new log file of ``directory``.
+
+    The file is named after the manifest ``filename`` and the current time.
+    When no directory is set or it cannot be created, the records are only sent to the other handlers.
+
+    Yields:
+        LogSink of the block, or None when there is no log file
+    """
+    if not directory:
+        yield None
+        return
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        logging.error(f'Error when trying to create the "{directory}" directory!')
+        yield None
+        return
+
+    _now_str = datetime.now().strftime('%Y%m%dT%H%M%S')
+    path = os.path.join(directory, f'log_{_now_str}_{Path(filename).stem}.log')
+
+    sink = LogSink(path, max_bytes=max_bytes, backup_count=backup_count)
+    root = logging.getLogger()
+    root.addHandler(sink)
+    token = _active.set(sink)
+    try:
+        yield sink
+    finally:
+        _active.reset(token)
+        root.removeHandler(sink)
+        sink.close()
+
+
+class LogCapture(logging.Handler):
+    """Keep the log records of a worker process, see `capture_logs`."""
+
+    def __init__(self, level=logging.INFO):
+        super().__init__(level)
+        self.records = []
+
+    def emit(self, record: logging.LogRecord):
+        # Plain values only, so the records can be sent to the parent process
+        self.records.append(dict(name=record.name, levelno=record.levelno, levelname=record.levelname,
+                                 msg=record.getMessage(), created=record.created))
+
+
+@contextmanager
+def capture_logs() -> Iterator[list]:
+    """Collect the log records of the block.
+
+    Yields:
+        list of the records, to be sent to the parent process and written with `replay`
+    """
+    capture = LogCapture()
+    root = logging.getLogger()
+    root.addHandler(capture)
+    try:
+        yield capture.records
+    finally:
+        root.removeHandler(capture)
+
+
+def replay(records: list):
+    """Write the records collected by `capture_logs` in the active log file."""
+    sink = _active.get()
+    if sink is None:
+        return
+
+    for values in records:
+        sink.handle(logging.makeLogRecord(values))
@@ -0,0 +1,118 @@
+"""Incremental reader of the manifest files.
+
+A manifest is either a JSON array of items or a sequence of JSON items, one per line
+(newline-delimited JSON). The items are decoded one at a time from a bounded buffer,
+so the memory used does not depend on the manifest size.
+"""
+
+import json
+
+from typing import Iterator
+
+#: Extensions of the manifest files searched in a directory
+MANIFEST_EXTENSIONS = ('.json', '.ndjson', '.jsonl')
+
+#: Longest token that may be cut at the end of the buffer (e.g. ``-Infinity`` or a ``\\uXXXX`` escape)
+_TOKEN_SIZE = 16
+
+
+class ManifestError(ValueError):
+    """Error decoding a manifest file."""
+
+
+def iter_manifest(filename: str, chunk_size: int = 1 << 20) -> Iterator[dict]:
+    """Iterate over the items of a manifest file.
+
+    Args:
+        filename - Path to the manifest (JSON array or newline-delimited JSON)
+        chunk_size - Number of characters read from the file at a time
+    Raises:
+        ManifestError when the manifest is not valid JSON
+    """
+    decoder = json.JSONDecoder()
+
+    with open(filename, 'r') as f:
+        buffer = ''
+        position = 0
+        eof = False
+
+        def _fill() -> bool:
+            """Read the next chunk, dropping what was already decoded."""
+            nonlocal buffer, position, eof
+            if eof:
+                return False
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[position:] + chunk
+            position = 0
+            return True
+
+        def _skip(characters: str) -> str:
+            """Skip the given characters and return the next one ('' at the end of the file)."""
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position] in characters:
+                    position += 1
+                if position < len(buffer):
+                    return buffer[position]
+                if not _fill():
+                    return ''
+
+        def _end_array():
+            """Check that only whitespace follows the closing bracket."""
+            nonlocal position
+            position += 1
+            if _skip(whitespace) != '':
+                raise ManifestError(f'{filename}: extra data after "]".')
+
+        whitespace = ' \t\r\n'
+
+        is_array = _skip(whitespace) == '['
+        if is_array:
+            position += 1
+            if _skip(whitespace) == ']':
+                _end_array()
+                return
+
+        while True:
+            token = _skip(whitespace)
+
+            if token == '':
+                if is_array:
+                    raise ManifestError(f'{filename}: unexpected end of file, missing "]".')
+                return
+
+            if is_array and token in ',]':
+                raise ManifestError(f'{filename}: unexpected "{token}", expected an item.')
+
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError as e:
+                    # Only a value cut at the end of the buffer is read further; any other error is
+                    # raised at once, without reading the rest of the file
+                    truncated = e.msg.startswith('Unterminated string') or e.pos >= len(buffer) - _TOKEN_SIZE
+                    if truncated and _fill():
+                        continue
+                    raise ManifestError(f'{filename}: {e}') from e
+
+                # A value ending at the end of the buffer may be truncated (e.g. a number)
+                if end == len(buffer) and _fill():
+                    continue
+                break
+
+            position = end
+            yield item
+
+            if is_array:
+                # The items of an array are separated by exactly one comma
+                token = _skip(whitespace)
+                if token == ']':
+                    _end_array()
+                    return
+                if token != ',':
+                    raise ManifestError(f'{filename}: expected "," or "]" after an item, '
+                                        f'found {repr(token) if token else "the end of the file"}.')
+                position += 1
@@ -0,0 +1,371 @@
+"""Per-item and per-stage timings of a run.
+
+An `ItemTimer` collects the time spent by an item in each stage (checksum, asset probe,
+srid, extent, footprint, NetCDF read, DB lookup and save). The code of a stage is wrapped
+in `stage`, which adds its duration to the item running in the current context; the
+assets prepared in a thread pool share the timer of their item, so the stage times are
+the sum over the threads.
+
+The recorded items are written as JSON lines and, optionally, as a Prometheus textfile
+(node_exporter textfile collector). `summary` lists the slowest stages and items of the
+file being processed, and the cProfile data of the slowest items may be dumped to
+inspect them with ``pstats`` or ``snakeviz``. The aggregates of a file follow the
+context, so manifests processed concurrently by the scheduler keep their own.
+"""
+
+import cProfile
+import heapq
+import json
+import os
+import pstats
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+_current: ContextVar[Optional['ItemTimer']] = ContextVar('item_timer', default=None)
+_current_run: ContextVar[Optional['_Run']] = ContextVar('metrics_run', default=None)
+_lock = threading.Lock()
+
+_metrics_file = None
+_prometheus_file = None
+_profile_items = 0
+_profile_dir = None
+_top = 10
+
+_output = None
+
+
+class _Stats:
+    """Count, sum and max of durations."""
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class _Run:
+    """Aggregates of the items recorded since `start_run`."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.items = dict()
+        self.item_seconds = _Stats()
+        self.stages = dict()
+        # Heap of the slowest items: (elapsed, sequence, timer)
+        self.slowest = []
+        self.sequence = 0
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages.setdefault(name, _Stats()).add(seconds)
+
+    def add_item(self, timer: 'ItemTimer', keep: int):
+        self.items[timer.status] = self.items.get(timer.status, 0) + 1
+        self.item_seconds.add(timer.elapsed)
+        for name, seconds in timer.stages.items():
+            self.add_stage(name, seconds)
+
+        if keep <= 0:
+            return
+
+        self.sequence += 1
+        entry = (timer.elapsed, self.sequence, timer)
+        if len(self.slowest) < keep:
+            heapq.heappush(self.slowest, entry)
+        else:
+            dropped = heapq.heappushpop(self.slowest, entry)[2]
+            # Only the profiles of the slowest items are kept
+            dropped.profiles = []
+
+
+_run = _Run()
+_totals = _Run()
+_queue = dict(depth=0, waits=_Stats())
+
+
+def _active_run() -> _Run:
+    """Aggregates of the file processed in the current context, see `start_run`."""
+    return _current_run.get() or _run
+
+
+class _ProfileStats:
+    """cProfile data returned by a worker process, in the format loaded by `pstats.Stats`."""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class ItemTimer:
+    """Timings of an item.
+
+    Args:
+        collection - Collection identifier of the item
+        name - Item name
+    """
+
+    def __init__(self, collection: str, name: str):
+        self.collection = collection
+        self.name = name
+        self.status = 'ok'
+        self.elapsed = 0.0
+        self.stages = dict()
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        """Add the duration of a stage."""
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def running(self):
+        """Run a block as part of the item: its stages and duration are added to the timer.
+
+        When the profiling is enabled, the block is profiled with cProfile.
+        """
+        profiler = cProfile.Profile() if _profile_items > 0 else None
+
+        token = _current.set(self)
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.create_stats()
+                self.profiles.append(profiler.stats)
+            self.elapsed += time.perf_counter() - start
+            _current.reset(token)
+
+    def export(self) -> dict:
+        """Timings to be sent from a worker process, see `merge`."""
+        return dict(elapsed=self.elapsed, stages=self.stages, profiles=self.profiles)
+
+    def merge(self, timings: Optional[dict]):
+        """Add the timings exported by a worker process."""
+        if not timings:
+            return
+        self.elapsed += timings['elapsed']
+        for stage, seconds in timings['stages'].items():
+            self.add(stage, seconds)
+        self.profiles.extend(timings['profiles'])
+
+    def as_dict(self) -> dict:
+        return dict(time=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S'),
+                    collection=self.collection,
+                    item=self.name,
+                    status=self.status,
+                    seconds=round(self.elapsed, 6),
+                    stages={stage: round(seconds, 6) for stage, seconds in self.stages.items()})
+
+
+def configure_metrics(metrics_file: Optional[str] = None,
+                      prometheus_file: Optional[str] = None,
+                      profile_items: int = 0,
+                      profile_dir: Optional[str] = None,
+                      top: int = 10):
+    """Set the outputs of the metrics.
+
+    Args:
+        metrics_file - JSON lines file where the timings of each item are appended
+        prometheus_file - Prometheus textfile rewritten at the end of each file
+        profile_items - Number of slowest items whose cProfile data is dumped (0 = profiling disabled)
+        profile_dir - Directory of the ``.prof`` files
+        top - Number of slowest items listed in the summary
+    """
+    global _metrics_file, _prometheus_file, _profile_items, _profile_dir, _top, _output, _totals, _queue
+
+    if _output is not None:
+        _output.close()
+        _output = None
+
+    _metrics_file = metrics_file
+    _prometheus_file = prometheus_file
+    _profile_items = max(0, int(profile_items))
+    _profile_dir = profile_dir
+    _top = max(1, int(top))
+    _totals = _Run()
+    _queue = dict(depth=0, waits=_Stats())
+    start_run()
+
+
+def start_run():
+    """Start the aggregates of a new file, see `summary`.
+
+    The aggregates belong to the current context (thread), so concurrent files do not mix.
+    """
+    global _run
+
+    with _lock:
+        _run = _Run()
+        _current_run.set(_run)
+
+
+def current_timer() -> Optional[ItemTimer]:
+    """Get the timer of the item running in the current context."""
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Time a stage.
+
+    The duration is added to the item running in the current context, or to the
+    aggregates of the run when no item is running (e.g. a batch commit).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        timer = _current.get()
+        if timer is not None:
+            timer.add(name, seconds)
+        else:
+            with _lock:
+                _active_run().add_stage(name, seconds)
+                _totals.add_stage(name, seconds)
+
+
+def record(timer: ItemTimer):
+    """Record the timings of a finished item."""
+    global _output
+
+    with _lock:
+        _active_run().add_item(timer, max(_top, _profile_items))
+        _totals.add_item(timer, 0)
+
+        if _metrics_file:
+            if _output is None:
+                os.makedirs(os.path.dirname(os.path.abspath(_metrics_file)), exist_ok=True)
+                _output = open(_metrics_file, 'a')
+            _output.write(json.dumps(timer.as_dict()) + '\n')
+            _output.flush()
+
+
+def summary() -> list:
+    """Summary of the items recorded since `start_run`: the slowest stages and items.
+
+    Returns:
+        list of lines
+    """
+    with _lock:
+        run = _active_run()
+        if not run.item_seconds.count:
+            return []
+
+        elapsed = time.perf_counter() - run.started
+        count = run.item_seconds.count
+        statuses = ', '.join(f'{status}: {value}' for status, value in sorted(run.items.items()))
+        lines = [f'Metrics: {count} items in {elapsed:.1f}s ({count / elapsed:.2f} items/s; {statuses}).']
+
+        busy = sum(stats.total for stats in run.stages.values()) or 1.0
+        for name, stats in sorted(run.stages.items(), key=lambda value: -value[1].total):
+            lines.append(f'Stage {name}: total {stats.total:.2f}s ({stats.total / busy:.0%}), '
+                         f'mean {stats.total / stats.count:.3f}s, max {stats.max:.3f}s, count {stats.count}.')
+
+        for elapsed, _, timer in sorted(run.slowest, reverse=True)[:_top]:
+            stages = ', '.join(f'{name} {seconds:.2f}s'
+                               for name, seconds in sorted(timer.stages.items(), key=lambda value: -value[1]))
+            lines.append(f'Slow item {timer.name} ({timer.collection}): {elapsed:.2f}s ({stages}).')
+
+    return lines
+
+
+def dump_profiles() -> list:
+    """Dump the cProfile data of the slowest items of the run.
+
+    Returns:
+        list of the files written
+    """
+    if not _profile_items:
+        return []
+
+    directory = _profile_dir or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    files = []
+    for elapsed, _, timer in sorted(_active_run().slowest, reverse=True)[:_profile_items]:
+        if not timer.profiles:
+            continue
+        stats = pstats.Stats(*[_ProfileStats(profile) for profile in timer.profiles])
+        name = re.sub(r'[^\w.-]', '_', f'{timer.collection}_{timer.name}')
+        path = os.path.join(directory, f'{name}.prof')
+        stats.dump_stats(path)
+        files.append(path)
+
+    return files
+
+
+def record_queue(depth: int, wait: Optional[float] = None):
+    """Record the number of manifests waiting in the scheduler and the wait of a started manifest."""
+    with _lock:
+        _queue['depth'] = depth
+        if wait is not None:
+            _queue['waits'].add(wait)
+
+
+def _label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_prometheus():
+    """Write the totals since `configure_metrics` to the Prometheus textfile, atomically."""
+    if not _prometheus_file:
+        return
+
+    with _lock:
+        lines = [
+            '# HELP collection_publisher_items_total Items processed, by status.',
+            '# TYPE collection_publisher_items_total counter',
+        ]
+        for status, value in sorted(_totals.items.items()):
+            lines.append(f'collection_publisher_items_total{{status="{_label(status)}"}} {value}')
+
+        lines += [
+            '# HELP collection_publisher_item_seconds Time spent per item.',
+            '# TYPE collection_publisher_item_seconds summary',
+            f'collection_publisher_item_seconds_sum {_totals.item_seconds.total:.6f}',
+            f'collection_publisher_item_seconds_count {_totals.item_seconds.count}',
+            '# HELP collection_publisher_stage_seconds Time spent per stage.',
+            '# TYPE collection_publisher_stage_seconds summary',
+        ]
+        for name, stats in sorted(_totals.stages.items()):
+            lines.append(f'collection_publisher_stage_seconds_sum{{stage="{_label(name)}"}} {stats.total:.6f}')
+            lines.append(f'collection_publisher_stage_seconds_count{{stage="{_label(name)}"}} {stats.count}')
+
+        lines += [
+            '# HELP collection_publisher_queue_depth Manifests waiting in the scheduler.',
+            '# TYPE collection_publisher_queue_depth gauge',
+            f'collection_publisher_queue_depth {_queue["depth"]}',
+            '# HELP collection_publisher_queue_wait_seconds Time waited by the manifests before starting.',
+            '# TYPE collection_publisher_queue_wait_seconds summary',
+            f'collection_publisher_queue_wait_seconds_sum {_queue["waits"].total:.6f}',
+            f'collection_publisher_queue_wait_seconds_count {_queue["waits"].count}',
+            '# HELP collection_publisher_last_run_timestamp_seconds End of the last processed file.',
+            '# TYPE collection_publisher_last_run_timestamp_seconds gauge',
+            f'collection_publisher_last_run_timestamp_seconds {time.time():.3f}',
+        ]
+
+    os.makedirs(os.path.dirname(os.path.abspath(_prometheus_file)), exist_ok=True)
+    tmp = f'{_prometheus_file}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp, _prometheus_file)
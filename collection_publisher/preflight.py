@@ -0,0 +1,170 @@
+"""Pre-flight validation of the assets of a manifest.
+
+Before an item is published, its assets are checked cheaply: the keys must be known
+(see ``assert_list_image`` and ``assert_list_files``), the item needs a data asset and
+each file must exist, be a non-empty regular file and be readable. The files are looked
+up with one ``os.scandir`` per directory, and the directories are listed concurrently,
+so a manifest of thousands of items costs a few directory listings instead of one
+failed `create_asset` per bad item.
+"""
+
+import json
+import os
+import stat
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging import info
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .config import assert_list_files, assert_list_image
+
+
+def key_role(key: str) -> Optional[str]:
+    """Role of an asset key, as assigned by `cli.asset_jobs`, or None for an invalid key."""
+    if key in ('thumbnail', 'PVI'):
+        return 'thumbnail'
+    if key in assert_list_image or 'BAND' in key:
+        return 'data'
+    if key in assert_list_files:
+        return 'file'
+    return None
+
+
+def _readable(st: os.stat_result) -> bool:
+    """Check the read permission of a file from its stat, without another system call."""
+    euid = os.geteuid()
+    if euid == 0:
+        return True
+    if st.st_uid == euid:
+        return bool(st.st_mode & stat.S_IRUSR)
+    if st.st_gid == os.getegid() or st.st_gid in os.getgroups():
+        return bool(st.st_mode & stat.S_IRGRP)
+    return bool(st.st_mode & stat.S_IROTH)
+
+
+def scan_directory(directory: str, names: set) -> dict:
+    """Check the files ``names`` of a directory with a single listing.
+
+    Returns:
+        dict name -> problem (``missing``, ``not a file``, ``empty``, ``unreadable`` or the
+        listing error), only for the files with a problem
+    """
+    problems = dict()
+
+    try:
+        entries = os.scandir(directory or '.')
+    except OSError as e:
+        return {name: e.strerror or 'directory not readable' for name in names}
+
+    found = set()
+    with entries:
+        for entry in entries:
+            if entry.name not in names:
+                continue
+            found.add(entry.name)
+            try:
+                if not entry.is_file():
+                    problems[entry.name] = 'not a file'
+                    continue
+                st = entry.stat()
+            except OSError as e:
+                problems[entry.name] = e.strerror or 'not readable'
+                continue
+            if st.st_size == 0:
+                problems[entry.name] = 'empty'
+            elif not _readable(st):
+                problems[entry.name] = 'unreadable'
+
+    for name in names - found:
+        problems[name] = 'missing'
+
+    return problems
+
+
+def check_items(items: Iterable[dict], workers: int = 16) -> tuple:
+    """Validate the assets of the items of a manifest.
+
+    Args:
+        items - Items of the manifest, see `manifest.iter_manifest`
+        workers - Number of directories listed concurrently
+    Returns:
+        tuple (number of items, dict item name -> list of problems), only for the items with problems
+    """
+    problems = dict()
+    directories = dict()
+    paths = []
+    total = 0
+
+    for item in items:
+        total += 1
+        name = item.get('name')
+        assets = item.get('assets') or dict()
+
+        item_problems = []
+        if not name:
+            name = f'#{total}'
+            item_problems.append('item without a name')
+
+        roles = set()
+        for key, path in assets.items():
+            role = key_role(key)
+            if role is None:
+                item_problems.append(f'invalid key: {key}')
+                continue
+            roles.add(role)
+
+            directory, filename = os.path.split(str(path))
+            directories.setdefault(directory, set()).add(filename)
+            paths.append((name, key, directory, filename))
+
+        if 'data' not in roles:
+            item_problems.append('no data asset')
+
+        if item_problems:
+            problems[name] = item_problems
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        listed = dict(zip(directories, executor.map(lambda args: scan_directory(*args), directories.items())))
+
+    for name, key, directory, filename in paths:
+        problem = listed[directory].get(filename)
+        if problem is not None:
+            problems.setdefault(name, []).append(f'{key}: {problem}: {os.path.join(directory, filename)}')
+
+    return total, problems
+
+
+def write_report(directory: str, filename: str, total: int, problems: dict) -> str:
+    """Write the pre-flight report of a manifest as JSON.
+
+    Returns:
+        str path of the report
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    _now_str = datetime.now().strftime('%Y%m%dT%H%M%S')
+    path = os.path.join(directory, f'preflight_{_now_str}_{Path(filename).stem}.json')
+
+    with open(path, 'w') as f:
+        json.dump(dict(manifest=str(filename), items=total, rejected=len(problems), problems=problems), f, indent=2)
+
+    return path
+
+
+def preflight(items: Iterable[dict], filename: str, report_dir: Optional[str] = None, workers: int = 16) -> dict:
+    """Validate the items of a manifest, log a summary and write the report.
+
+    Returns:
+        dict item name -> list of problems of the rejected items
+    """
+    total, problems = check_items(items, workers)
+
+    info(f'Pre-flight of {filename}: {total - len(problems)} of {total} items can be published, '
+         f'{len(problems)} rejected.')
+
+    if report_dir:
+        info(f'Pre-flight report saved in {write_report(report_dir, filename, total, problems)}')
+
+    return problems
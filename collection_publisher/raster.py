@@ -0,0 +1,396 @@
+"""Raster metadata probe.
+
+A `RasterProbe` opens a raster once and exposes the metadata needed to publish an item
+(shape, block size, CRS/EPSG, bounds, transform and dataset mask). Inside a `probe_scope`
+the probes are memoized per path, so the asset, srid, extent and footprint steps of an
+item share a single open of each file.
+
+NetCDF files are read by a `NetCDFProbe`, which reads the shape, chunking and attributes
+with netCDF4 and only opens the file with rasterio (GDAL) when another property is used.
+GeoTIFF files are read by a `TiffHeaderProbe`, which parses the shape, tile size and
+number of overviews from the TIFF header (the first few KB of a COG), so probing an asset
+costs a few small reads whatever the size of the file.
+"""
+
+import struct
+import threading
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import netCDF4
+
+_scope: ContextVar[Optional[dict]] = ContextVar('raster_probe_scope', default=None)
+_lock = threading.Lock()
+
+#: Extensions of the files read by `NetCDFProbe`
+NETCDF_EXTENSIONS = ('.nc', '.nc4')
+#: Extensions of the files read by `TiffHeaderProbe`
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+
+
+class RasterProbe:
+    """Metadata of a raster read from a single open of the file.
+
+    Use it as a context manager: the file is closed at the end of the block,
+    unless the probe belongs to a `probe_scope`, which closes it at the end of the scope.
+
+    Args:
+        path - Path to the raster
+    """
+
+    def __init__(self, path: str, scoped: bool = False):
+        self.path = str(path)
+        self.scoped = scoped
+
+        import rasterio
+
+        self.dataset = rasterio.open(self.path)
+        self._epsg = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if not self.scoped:
+            self.close()
+
+    def close(self):
+        self.dataset.close()
+
+    @property
+    def shape(self) -> tuple:
+        """Raster shape (rows, cols)."""
+        return self.dataset.shape
+
+    @property
+    def block_size(self) -> tuple:
+        """Block size (x, y) of the first band, or (None, None) when unknown."""
+        if not self.dataset.block_shapes:
+            return None, None
+        rows, cols = self.dataset.block_shapes[0]
+        return cols, rows
+
+    @property
+    def grid_signature(self) -> tuple:
+        """Grid of the raster: shape, transform and CRS. Rasters with the same signature share their geometries."""
+        crs = self.dataset.crs
+        return self.shape, tuple(self.dataset.transform)[:6], crs.to_wkt() if crs is not None else None
+
+    @property
+    def overview_count(self) -> int:
+        """Number of overviews of the first band."""
+        return len(self.dataset.overviews(1))
+
+    @property
+    def crs(self):
+        return self.dataset.crs
+
+    @property
+    def bounds(self):
+        return self.dataset.bounds
+
+    @property
+    def transform(self):
+        return self.dataset.transform
+
+    @property
+    def epsg(self) -> Optional[int]:
+        """Authority code of the raster CRS, or None when no code is found.
+
+        Note:
+            The fallback to the OGR authority lookup requires GDAL.
+        """
+        if self._epsg is False:
+            self._epsg = None
+
+            crs = self.dataset.crs
+            if crs is not None:
+                self._epsg = crs.to_epsg()
+
+                if self._epsg is None:
+                    from osgeo import osr
+
+                    ref = osr.SpatialReference()
+                    ref.ImportFromWkt(crs.to_wkt())
+
+                    code = ref.GetAuthorityCode(None)
+                    self._epsg = int(code) if str(code).isnumeric() else None
+
+        return self._epsg
+
+    def dataset_mask(self, out_shape: Optional[tuple] = None):
+        """Read the dataset mask, optionally decimated to ``out_shape`` (rows, cols)."""
+        return self.dataset.dataset_mask(out_shape=out_shape)
+
+
+def _data_variable(nc) -> Optional['netCDF4.Variable']:
+    """Main 2D variable of a NetCDF dataset: the first one with a grid mapping, else the largest one."""
+    variables = [variable for variable in nc.variables.values() if variable.ndim >= 2]
+    for variable in variables:
+        if 'grid_mapping' in variable.ncattrs():
+            return variable
+    return max(variables, key=lambda variable: variable.size, default=None)
+
+
+class _HeaderProbe:
+    """Base of the probes that read the header of a file without GDAL.
+
+    The properties not read from the header come from a `RasterProbe` opened on demand.
+    """
+
+    def __init__(self, path: str, scoped: bool = False):
+        self._fallback = None
+        self.path = str(path)
+        self.scoped = scoped
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._fallback is None:
+            self._fallback = RasterProbe(self.path)
+        return getattr(self._fallback, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if not self.scoped:
+            self.close()
+
+    def close(self):
+        if self._fallback is not None:
+            self._fallback.close()
+            self._fallback = None
+
+
+class NetCDFProbe(_HeaderProbe):
+    """Metadata of a NetCDF file read with netCDF4 in a single open.
+
+    The file is closed as soon as the metadata is read. The properties not read here
+    (``crs``, ``bounds``, ``epsg``, ``dataset_mask``, ...) come from a `RasterProbe`
+    opened on demand.
+
+    Args:
+        path - Path to the NetCDF file
+    """
+
+    def __init__(self, path: str, scoped: bool = False):
+        super().__init__(path, scoped)
+
+        from netCDF4 import Dataset
+
+        with Dataset(self.path) as nc:
+            #: Global attributes
+            self.attributes = {name: nc.getncattr(name) for name in nc.ncattrs()}
+
+            variable = _data_variable(nc)
+            #: Name of the main 2D variable
+            self.variable = variable.name if variable is not None else None
+            #: Attributes of the grid mapping variable of the main variable
+            self.grid_mapping = dict()
+            #: Attributes of the variable ``geospatial_lat_lon_extent``, when present
+            self.extent = dict()
+
+            self.shape = None
+            self.block_size = (None, None)
+
+            if variable is not None:
+                self.shape = tuple(variable.shape[-2:])
+
+                chunking = variable.chunking()
+                if isinstance(chunking, list):
+                    self.block_size = (chunking[-1], chunking[-2])
+
+                mapping = getattr(variable, 'grid_mapping', None)
+                if mapping in nc.variables:
+                    grid = nc.variables[mapping]
+                    self.grid_mapping = {name: grid.getncattr(name) for name in grid.ncattrs()}
+
+            if 'geospatial_lat_lon_extent' in nc.variables:
+                extent = nc.variables['geospatial_lat_lon_extent']
+                self.extent = {name: extent.getncattr(name) for name in extent.ncattrs()}
+
+
+#: TIFF tags read by `TiffHeaderProbe`
+_NEW_SUBFILE_TYPE, _IMAGE_WIDTH, _IMAGE_LENGTH, _COMPRESSION, _ROWS_PER_STRIP = 254, 256, 257, 259, 278
+_TILE_WIDTH, _TILE_LENGTH = 322, 323
+
+#: GeoTIFF tags: ModelPixelScale, ModelTiepoint, ModelTransformation and the GeoKey directory and parameters
+_GEO_TAGS = (33550, 33922, 34264, 34735, 34736, 34737)
+
+#: struct format of the TIFF field types holding integers: SHORT, LONG and LONG8
+_TIFF_INTEGERS = {3: 'H', 4: 'I', 16: 'Q'}
+#: struct format of the TIFF field types of the GeoTIFF tags: ASCII, SHORT, LONG, FLOAT, DOUBLE and LONG8
+_TIFF_VALUES = {2: 's', 3: 'H', 4: 'I', 11: 'f', 12: 'd', 16: 'Q'}
+
+#: Maximum number of IFDs read, in case of a corrupted IFD chain
+_MAX_IFDS = 64
+
+
+class TiffHeaderProbe(_HeaderProbe):
+    """Metadata of a GeoTIFF read from its header, without opening a GDAL dataset.
+
+    The image file directories (IFDs) of the file are parsed for the size, the tile
+    size, the number of overviews and the raw GeoTIFF tags (see `grid_signature`). The
+    georeferencing (``crs``, ``bounds``, ``epsg``, ...) and the block size of uncompressed
+    strips, which GDAL reports split, come from a `RasterProbe` opened on demand.
+
+    Args:
+        path - Path to the TIFF file
+    Raises:
+        ValueError when the file is not a TIFF or its header cannot be parsed
+    """
+
+    def __init__(self, path: str, scoped: bool = False):
+        super().__init__(path, scoped)
+
+        with open(self.path, 'rb') as f:
+            ifds, geotags = self._read_ifds(f)
+
+        first = ifds[0]
+        if _IMAGE_WIDTH not in first or _IMAGE_LENGTH not in first:
+            raise ValueError(f'{self.path}: TIFF without image size')
+
+        #: Raster shape (rows, cols)
+        self.shape = (first[_IMAGE_LENGTH], first[_IMAGE_WIDTH])
+        #: Flag for a tiled TIFF (COG)
+        self.tiled = _TILE_WIDTH in first and _TILE_LENGTH in first
+        #: Number of overviews: reduced resolution images, except the masks
+        self.overview_count = sum(1 for ifd in ifds[1:] if ifd.get(_NEW_SUBFILE_TYPE, 0) & 0b101 == 0b001)
+
+        #: Grid of the raster: shape and GeoTIFF tags (transform and CRS), see `RasterProbe.grid_signature`
+        self.grid_signature = (self.shape,) + tuple(geotags.get(tag) for tag in _GEO_TAGS)
+
+        if self.tiled:
+            self.block_size = (first[_TILE_WIDTH], first[_TILE_LENGTH])
+        elif first.get(_COMPRESSION, 1) != 1:
+            self.block_size = (first[_IMAGE_WIDTH], min(first.get(_ROWS_PER_STRIP, self.shape[0]), self.shape[0]))
+
+    @staticmethod
+    def _read_ifds(f) -> tuple:
+        """Read the integer tags of the IFD chain and the GeoTIFF tags of the first IFD.
+
+        Returns:
+            tuple (list of dict tag -> value, one per IFD, dict GeoTIFF tag -> tuple of values)
+        """
+        header = f.read(16)
+        if header[:2] == b'II':
+            order = '<'
+        elif header[:2] == b'MM':
+            order = '>'
+        else:
+            raise ValueError('not a TIFF file')
+
+        version, = struct.unpack(order + 'H', header[2:4])
+        if version == 42:
+            offset, = struct.unpack(order + 'I', header[4:8])
+            count_format, entry_format, next_format, inline = 'H', 'HHI4s', 'I', 4
+        elif version == 43:
+            offset, = struct.unpack(order + 'Q', header[8:16])
+            count_format, entry_format, next_format, inline = 'Q', 'HHQ8s', 'Q', 8
+        else:
+            raise ValueError('not a TIFF file')
+
+        count_size = struct.calcsize(order + count_format)
+        entry_size = struct.calcsize(order + entry_format)
+        next_size = struct.calcsize(order + next_format)
+
+        ifds = []
+        geo_entries = []
+        while offset and len(ifds) < _MAX_IFDS:
+            f.seek(offset)
+            count, = struct.unpack(order + count_format, f.read(count_size))
+            data = f.read(count * entry_size + next_size)
+            if len(data) < count * entry_size + next_size:
+                raise ValueError('truncated TIFF header')
+
+            tags = dict()
+            for index in range(count):
+                tag, field_type, values, value = struct.unpack_from(order + entry_format, data, index * entry_size)
+                # The tags read here hold a single integer, stored in the entry itself
+                if values == 1 and field_type in _TIFF_INTEGERS:
+                    tags[tag], = struct.unpack_from(order + _TIFF_INTEGERS[field_type], value)
+                elif not ifds and tag in _GEO_TAGS and field_type in _TIFF_VALUES:
+                    geo_entries.append((tag, field_type, values, value))
+            ifds.append(tags)
+
+            offset, = struct.unpack_from(order + next_format, data, count * entry_size)
+
+        if not ifds:
+            raise ValueError('TIFF without image')
+
+        geotags = dict()
+        for tag, field_type, values, value in geo_entries:
+            item_format = f'{values}{_TIFF_VALUES[field_type]}'
+            size = struct.calcsize(order + item_format)
+            if size > inline:
+                # Stored out of the entry, which holds its offset
+                f.seek(struct.unpack(order + next_format, value)[0])
+                value = f.read(size)
+                if len(value) < size:
+                    raise ValueError('truncated TIFF header')
+            geotags[tag] = struct.unpack_from(order + item_format, value)
+
+        return ifds, geotags
+
+
+def open_probe(path: str, scoped: bool = False):
+    """Open the probe of a file, chosen by its extension.
+
+    A TIFF whose header cannot be parsed is opened with rasterio.
+    """
+    extension = str(path).lower()
+    if extension.endswith(NETCDF_EXTENSIONS):
+        return NetCDFProbe(path, scoped=scoped)
+    if extension.endswith(TIFF_EXTENSIONS):
+        try:
+            return TiffHeaderProbe(path, scoped=scoped)
+        except (ValueError, struct.error):
+            pass
+    return RasterProbe(path, scoped=scoped)
+
+
+@contextmanager
+def probe_scope():
+    """Memoize the probes opened by `probe_raster` in the block and close them at its end.
+
+    Nested scopes reuse the outer one. The scope follows the context, so the tasks
+    submitted with `contextvars.copy_context` share it.
+    """
+    if _scope.get() is not None:
+        yield
+        return
+
+    probes = dict()
+    token = _scope.set(probes)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+        for probe in probes.values():
+            probe.close()
+
+
+def probe_raster(path: str) -> RasterProbe:
+    """Get the probe of a raster, memoized when inside a `probe_scope`."""
+    probes = _scope.get()
+    if probes is None:
+        return open_probe(path)
+
+    path = str(path)
+    with _lock:
+        probe = probes.get(path)
+
+    if probe is None:
+        # Open outside of the lock, so the assets of an item are opened concurrently
+        probe = open_probe(path, scoped=True)
+        with _lock:
+            memoized = probes.setdefault(path, probe)
+        if memoized is not probe:
+            probe.close()
+            probe = memoized
+
+    return probe
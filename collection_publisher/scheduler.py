@@ -0,0 +1,153 @@
+"""Scheduler of the manifests of a directory run.
+
+The manifests found in ``--directory`` are queued and started by priority instead of in
+the order of the file system, so a small near-real-time manifest (e.g. GOES) does not wait
+behind a large backfill. The priority is built from the criteria of ``order``:
+
+- ``collection``: the priority of the collection of the manifest (highest first);
+- ``age``: the modification time of the manifest (oldest first);
+- ``size``: the size of the manifest (smallest first).
+
+Up to ``workers`` manifests run concurrently, in threads, and at most ``limits[collection]``
+of a collection at a time. The queue depth and the time waited by each manifest are logged
+and recorded in the metrics (see `metrics.record_queue`).
+
+The manifests run in threads, so ``workers`` > 1 can not be combined with the item process
+pools (``--workers`` > 1): a process forked from a threaded process may inherit a lock held
+by another thread and deadlock. The command line rejects that combination.
+"""
+
+import os
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging import error, info
+from typing import Callable, Optional
+
+from .manifest import ManifestError, iter_manifest
+from .metrics import record_queue
+
+#: Criteria of the priority of a manifest
+SCHEDULE_CRITERIA = ('collection', 'age', 'size')
+
+
+def manifest_collection(path: str, default: str) -> str:
+    """Collection of a manifest: the key ``collection`` of its first item, else ``default``."""
+    try:
+        for item in iter_manifest(path):
+            return item.get('collection', default)
+    except (IOError, ManifestError):
+        pass
+    return default
+
+
+class QueuedManifest:
+    """Manifest waiting in the `Scheduler`."""
+
+    def __init__(self, path: str, collection: str, size: int, mtime: float):
+        self.path = path
+        self.collection = collection
+        self.size = size
+        self.mtime = mtime
+        self.queued = time.perf_counter()
+
+
+class Scheduler:
+    """Run the manifests of a directory by priority, with concurrency limits.
+
+    Args:
+        run - Function that processes a manifest, called with its path
+        workers - Number of manifests processed concurrently
+        order - Criteria of the priority, see `SCHEDULE_CRITERIA`
+        priorities - dict collection -> priority (default 0, the highest runs first)
+        limits - dict collection -> maximum number of its manifests running at a time
+    """
+
+    def __init__(self, run: Callable[[str], None], workers: int = 1, order=SCHEDULE_CRITERIA,
+                 priorities: Optional[dict] = None, limits: Optional[dict] = None):
+        invalid = [criterion for criterion in order if criterion not in SCHEDULE_CRITERIA]
+        if invalid:
+            raise ValueError(f'Invalid schedule criteria {invalid}, expected some of {SCHEDULE_CRITERIA}.')
+
+        self.run = run
+        self.workers = max(1, workers)
+        self.order = tuple(order)
+        self.priorities = priorities or dict()
+        self.limits = {collection: max(1, limit) for collection, limit in (limits or dict()).items()}
+        self.queue = []
+        self.running = dict()
+        self.waits = dict()
+        self._lock = threading.Lock()
+
+    def add(self, path: str, collection: str):
+        """Queue a manifest."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            error(f'The file {path} does not exist.')
+            return
+        self.queue.append(QueuedManifest(str(path), collection, stat.st_size, stat.st_mtime))
+
+    def priority(self, manifest: QueuedManifest) -> tuple:
+        """Sort key of a manifest: the lowest runs first."""
+        values = dict(collection=-self.priorities.get(manifest.collection, 0),
+                      age=manifest.mtime,
+                      size=manifest.size)
+        return tuple(values[criterion] for criterion in self.order) + (manifest.path,)
+
+    def _next(self) -> Optional[QueuedManifest]:
+        """Take the first manifest of the queue whose collection is below its limit."""
+        with self._lock:
+            for index, manifest in enumerate(self.queue):
+                limit = self.limits.get(manifest.collection)
+                if limit is None or self.running.get(manifest.collection, 0) < limit:
+                    self.running[manifest.collection] = self.running.get(manifest.collection, 0) + 1
+                    return self.queue.pop(index)
+        return None
+
+    def _start(self, manifest: QueuedManifest):
+        waited = time.perf_counter() - manifest.queued
+        self.waits.setdefault(manifest.collection, []).append(waited)
+        record_queue(len(self.queue), waited)
+        info(f'Starting {manifest.path} ({manifest.collection}, {manifest.size} bytes) after {waited:.1f}s '
+             f'in the queue; {len(self.queue)} manifests queued.')
+
+    def _run(self, manifest: QueuedManifest):
+        try:
+            self.run(manifest.path)
+        except Exception as e:
+            error(f'Error processing the file {manifest.path}: {e}')
+        finally:
+            with self._lock:
+                self.running[manifest.collection] -= 1
+
+    def run_all(self):
+        """Process the queued manifests and log the time they waited."""
+        self.queue.sort(key=self.priority)
+        info(f'{len(self.queue)} manifests queued, {self.workers} processed at a time.')
+
+        if self.workers == 1:
+            while self.queue:
+                manifest = self._next()
+                self._start(manifest)
+                self._run(manifest)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='manifest') as executor:
+                futures = set()
+                while self.queue or futures:
+                    # Start the eligible manifests, by priority, while there are free workers
+                    while len(futures) < self.workers:
+                        manifest = self._next()
+                        if manifest is None:
+                            break
+                        self._start(manifest)
+                        futures.add(executor.submit(self._run, manifest))
+
+                    _, futures = wait(futures, return_when=FIRST_COMPLETED)
+
+        record_queue(0)
+
+        for collection, waits in sorted(self.waits.items()):
+            info(f'Queue of {collection}: {len(waits)} manifests, wait mean {sum(waits) / len(waits):.1f}s, '
+                 f'max {max(waits):.1f}s.')
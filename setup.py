@@ -12,10 +12,16 @@ install_requires = ["Shapely==1.8.5.post1",
                     "pyproject==1.3.1",
                     "filelock==3.13.1",
                     "rasterio==1.3.9",
+                    "pyproj==3.4.1",
                     "netCDF4==1.6.5",
                     "bdc-catalog @ git+https://github.com/brazil-data-cube/bdc-catalog.git@v1.0.2#egg=bdc-catalog"
                     ]
 
+extras_require = {
+    # inotify para o modo --watch (sem ele o diretório é varrido periodicamente)
+    "watch": ["inotify_simple==1.3.5"],
+}
+
 packages = find_packages()
 
 g = {}
@@ -36,6 +42,7 @@ setup(
         ],
     },
     install_requires=install_requires,
+    extras_require=extras_require,
     classifiers=[
         "Development Status :: Alpha",
         "Environment :: Console",
@@ -0,0 +1,90 @@
+import json
+import tracemalloc
+
+import pytest
+
+from collection_publisher.manifest import ManifestError, iter_manifest
+
+#: Chunk sizes that cut the values at every position, and the default one
+CHUNK_SIZES = (1, 2, 3, 7, 1 << 20)
+
+ITEMS = [
+    {'name': 'CBERS4A_WFI_1', 'start_date': '2023-01-01T00:00:00', 'assets': {'red': '/data/a, b]/red.tif'}},
+    {'name': 'nested "quotes" and \\ escapes é', 'values': [1, -2.5e-3, None, True, {'a': [[], {}]}]},
+    {'name': 'numbers', 'values': [12345678901234567890, -0.0, 1e308]},
+]
+
+
+def _write(tmp_path, text, name='manifest.json'):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('text', [
+    json.dumps(ITEMS),
+    json.dumps(ITEMS, indent=4),
+    ' \n[\r\n' + ' ,\n'.join(json.dumps(item) for item in ITEMS) + '\t]\n\n',
+])
+def test_array(tmp_path, text, chunk_size):
+    assert list(iter_manifest(_write(tmp_path, text), chunk_size)) == ITEMS
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('text', ['[]', ' [ \n ] \n'])
+def test_empty_array(tmp_path, text, chunk_size):
+    assert list(iter_manifest(_write(tmp_path, text), chunk_size)) == []
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('text', [
+    ''.join(json.dumps(item) + '\n' for item in ITEMS),
+    '\n'.join(json.dumps(item) for item in ITEMS),
+    '\r\n\r\n'.join(json.dumps(item) for item in ITEMS) + '\r\n',
+])
+def test_ndjson(tmp_path, text, chunk_size):
+    assert list(iter_manifest(_write(tmp_path, text, 'manifest.jsonl'), chunk_size)) == ITEMS
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('text', [
+    '[{"a": 1},]',
+    '[{"a": 1},,{"b": 2}]',
+    '[,{"a": 1}]',
+    '[{"a": 1} {"b": 2}]',
+    '[{"a": 1}',
+    '[{"a": 1},',
+    '[{"a": 1}] {"b": 2}',
+    '[{"a": 1}]]',
+    '[{"a": 1, }]',
+    '[{"a": "unterminated}]',
+    '{"a": 1}\n{"b": }\n',
+])
+def test_invalid(tmp_path, text, chunk_size):
+    with pytest.raises(ManifestError):
+        list(iter_manifest(_write(tmp_path, text), chunk_size))
+
+
+def test_items_before_the_error(tmp_path):
+    items = iter_manifest(_write(tmp_path, '[{"a": 1}, {"b": 2} {"c": 3}]'), 4)
+
+    assert next(items) == {'a': 1}
+    assert next(items) == {'b': 2}
+    with pytest.raises(ManifestError):
+        next(items)
+
+
+def test_error_does_not_read_the_rest_of_the_file(tmp_path):
+    tail = ',\n'.join(json.dumps(dict(ITEMS[0], name=f'item_{i}')) for i in range(40000))
+    path = _write(tmp_path, '[{"a": 1}, {"b": 2,, "c": 3},\n' + tail + ']')
+
+    tracemalloc.start()
+    try:
+        with pytest.raises(ManifestError):
+            list(iter_manifest(path, 1024))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak < 1 << 20
@@ -0,0 +1,150 @@
+import struct
+
+import numpy
+import pytest
+
+rasterio = pytest.importorskip('rasterio')
+
+from rasterio.crs import CRS
+from rasterio.transform import Affine, from_origin
+
+from collection_publisher.raster import RasterProbe, TiffHeaderProbe, open_probe
+
+#: GeoKeys of the CRS code: ProjectedCSTypeGeoKey and GeographicTypeGeoKey
+_CRS_KEYS = (3072, 2048)
+
+PROFILES = {
+    'striped': dict(dtype='uint16', nodata=0, crs='EPSG:32723', tiled=False),
+    'striped-deflate': dict(dtype='int16', nodata=-9999, crs='EPSG:4326', tiled=False, compress='deflate'),
+    'tiled': dict(dtype='float32', nodata=-1.5, crs='EPSG:32722', tiled=True, blockxsize=256, blockysize=256,
+                  compress='deflate', overviews=(2, 4)),
+    'bigtiff': dict(dtype='uint8', nodata=255, crs='EPSG:32723', tiled=True, blockxsize=128, blockysize=128,
+                    BIGTIFF='YES', overviews=(2,)),
+    'big-endian': dict(dtype='float64', nodata=None, crs='EPSG:4674', tiled=False, ENDIANNESS='BIG'),
+    'big-endian-bigtiff': dict(dtype='int32', nodata=-1, crs='EPSG:32723', tiled=True, blockxsize=256,
+                               blockysize=256, BIGTIFF='YES', ENDIANNESS='BIG'),
+}
+
+
+def _write_tiff(path, width=700, height=500, overviews=(), **options):
+    geographic = CRS.from_user_input(options['crs']).is_geographic
+    transform = from_origin(-45.1, -10.2, 0.0001, 0.0001) if geographic else from_origin(500010, 8900020, 10, 10)
+    data = (numpy.arange(width * height) % 200).reshape(height, width).astype(options['dtype'])
+
+    with rasterio.open(path, 'w', driver='GTiff', width=width, height=height, count=1,
+                       transform=transform, **options) as dataset:
+        dataset.write(data, 1)
+        if overviews:
+            dataset.build_overviews(list(overviews))
+    return str(path)
+
+
+def _geotiff_transform(signature):
+    """Affine transform of the GeoTIFF tags of a grid signature (ModelPixelScale and ModelTiepoint)."""
+    _, scale, tiepoint, _, _, _, _ = signature
+    i, j, _, x, y, _ = tiepoint
+    return Affine(scale[0], 0, x - i * scale[0], 0, -scale[1], y + j * scale[1])
+
+
+def _geotiff_epsg(signature):
+    """EPSG code of the GeoKey directory of a grid signature."""
+    keys = signature[4]
+    for index in range(4, 4 * (keys[3] + 1), 4):
+        key, location, _, value = keys[index:index + 4]
+        if key in _CRS_KEYS and location == 0:
+            return value
+    return None
+
+
+@pytest.fixture(params=sorted(PROFILES))
+def tiff(request, tmp_path):
+    return request.param, _write_tiff(tmp_path / f'{request.param}.tif', **PROFILES[request.param])
+
+
+def test_header(tiff):
+    name, path = tiff
+
+    with rasterio.open(path) as dataset, open_probe(path) as probe:
+        assert isinstance(probe, TiffHeaderProbe)
+        assert probe.shape == dataset.shape
+        assert probe.tiled == PROFILES[name]['tiled']
+        assert probe.overview_count == len(dataset.overviews(1))
+        assert _geotiff_transform(probe.grid_signature) == dataset.transform
+        assert _geotiff_epsg(probe.grid_signature) == dataset.crs.to_epsg()
+        if probe.tiled or PROFILES[name].get('compress'):
+            assert probe.block_size == tuple(reversed(dataset.block_shapes[0]))
+        # Read from the header only
+        assert probe._fallback is None
+
+
+def test_rasterio_properties(tiff):
+    name, path = tiff
+
+    with rasterio.open(path) as dataset, open_probe(path) as probe:
+        assert probe.block_size == tuple(reversed(dataset.block_shapes[0]))
+        assert probe.crs == dataset.crs
+        assert probe.transform == dataset.transform
+        assert probe.bounds == dataset.bounds
+        assert probe.epsg == dataset.crs.to_epsg()
+        assert probe.dataset.dtypes == dataset.dtypes == (PROFILES[name]['dtype'],)
+        assert probe.dataset.nodata == dataset.nodata == PROFILES[name]['nodata']
+
+
+def test_same_grid(tmp_path):
+    first = _write_tiff(tmp_path / 'a.tif', **PROFILES['tiled'])
+    second = _write_tiff(tmp_path / 'b.tif', **dict(PROFILES['striped'], crs=PROFILES['tiled']['crs']))
+    other = _write_tiff(tmp_path / 'c.tif', width=701, **PROFILES['tiled'])
+
+    with open_probe(first) as a, open_probe(second) as b, open_probe(other) as c:
+        assert a.grid_signature == b.grid_signature
+        assert a.grid_signature != c.grid_signature
+
+
+@pytest.mark.filterwarnings('ignore::rasterio.errors.NotGeoreferencedWarning')
+def test_not_a_tiff(tmp_path):
+    path = str(tmp_path / 'image.tif')
+    with rasterio.open(path, 'w', driver='PNG', width=10, height=20, count=1, dtype='uint8') as dataset:
+        dataset.write(numpy.zeros((20, 10), dtype='uint8'), 1)
+
+    with pytest.raises(ValueError):
+        TiffHeaderProbe(path)
+
+    with open_probe(path) as probe:
+        assert isinstance(probe, RasterProbe)
+        assert probe.shape == (20, 10)
+
+
+@pytest.mark.parametrize('size', [0, 3, 8, 12])
+def test_truncated_header(tmp_path, size):
+    path = _write_tiff(tmp_path / 'image.tif', **PROFILES['striped'])
+    with open(path, 'rb') as f:
+        header = f.read(size)
+    with open(path, 'wb') as f:
+        f.write(header)
+
+    with pytest.raises((ValueError, struct.error)):
+        TiffHeaderProbe(path)
+
+    # Opened with rasterio instead, which reports the broken file
+    with pytest.raises(rasterio.errors.RasterioIOError):
+        open_probe(path)
+
+
+def test_corrupt_ifd_chain(tmp_path):
+    path = _write_tiff(tmp_path / 'image.tif', **PROFILES['striped'])
+
+    with open(path, 'r+b') as f:
+        f.seek(4)
+        offset, = struct.unpack('<I', f.read(4))
+        f.seek(offset)
+        count, = struct.unpack('<H', f.read(2))
+        # Point the next IFD of the chain past the end of the file
+        f.seek(offset + 2 + count * 12)
+        f.write(struct.pack('<I', 1 << 30))
+
+    with pytest.raises((ValueError, struct.error)):
+        TiffHeaderProbe(path)
+
+    with rasterio.open(path) as dataset, open_probe(path) as probe:
+        assert isinstance(probe, RasterProbe)
+        assert probe.shape == dataset.shape